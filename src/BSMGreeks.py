@@ -0,0 +1,78 @@
+import numpy as np
+
+from src.BlackScholesMerton import BlackScholesMerton
+
+
+class BSMGreeks:
+
+    '''
+    Closed-form Black-Scholes-Merton Greeks, computed for a whole chain at once.
+
+    d1, d2, N'(d1), N(+/-d1), N(+/-d2), and the sigma-independent terms from BlackScholesMerton.computeContractTerms()
+    are computed once per contract, and every Greek (and the price) is built from those, so all of them together cost about the same as one price.
+
+    Units:
+        - vega, vanna, and volga are per 1.00 (100%) change in sigma, not per 1%.
+        - theta is per year (divide by 365 for per calendar day); it is dPrice/dt, so it is usually negative.
+        - rho is per 1.00 (100%) change in r.
+
+    References:
+        - https://en.wikipedia.org/wiki/Greeks_(finance)#Formulae_for_European_option_Greeks
+    '''
+
+    def __init__(me, normKernel: str = 'ndtr'):
+        ''' :param normKernel: see BlackScholesMerton.__init__() '''
+        me.bs = BlackScholesMerton(normKernel=normKernel)
+
+    def computeGreeks(me, isCall, sigma, yte, S, K, r, contractTerms: dict = None):
+        '''
+        All parameters may be NumPy arrays or scalars, as long as they broadcast together.
+
+        :param isCall: boolean (or 0/1 int) mask; True/1 for calls, False/0 for puts.
+        :param sigma: IV
+        :param yte: years to expiry
+        :param S: current price of underlying
+        :param K: strike of option
+        :param r: risk-free rate
+        :param contractTerms: optional, from BlackScholesMerton.computeContractTerms(yte, S, K, r), e.g. the same ones used to solve for IV.
+        :return: dict of float64 arrays, keyed by 'price', 'delta', 'gamma', 'vega', 'theta', 'rho', 'vanna', and 'volga'.
+        '''
+        # Broadcast up front, so Greeks that don't depend on the right (gamma, vega, ...) come back with the full shape too.
+        if contractTerms is None:
+            contractTerms = me.bs.computeContractTerms(yte, S, K, r)
+        isCall, sigma, *termValues = np.broadcast_arrays(np.asarray(isCall, dtype=bool), np.asarray(sigma, dtype=np.float64), *contractTerms.values())
+        terms = dict(zip(contractTerms.keys(), termValues))
+        yte, S, r, sqrtYte, discountedK = terms['yte'], terms['S'], terms['r'], terms['sqrtYte'], terms['discountedK']
+        d1 = me.bs.computeD1FromTerms(sigma, terms)
+        d2 = d1 - sigma*sqrtYte
+        pdfD1 = me.bs.normPdf(d1)
+        # w flips the sign for puts (see BlackScholesMerton.priceOptions()).
+        w = np.where(isCall, 1.0, -1.0)
+        cdfWD1 = me.bs.normCdf(w*d1)
+        cdfWD2 = me.bs.normCdf(w*d2)
+
+        vega = S*pdfD1*sqrtYte
+        greeks = {}
+        greeks['price'] = w*(cdfWD1*S - cdfWD2*discountedK)
+        greeks['delta'] = w*cdfWD1
+        greeks['gamma'] = pdfD1/(S*sigma*sqrtYte)
+        greeks['vega'] = vega
+        greeks['theta'] = -S*pdfD1*sigma/(2*sqrtYte) - w*r*discountedK*cdfWD2
+        greeks['rho'] = w*yte*discountedK*cdfWD2
+        greeks['vanna'] = -pdfD1*d2/sigma
+        greeks['volga'] = vega*d1*d2/sigma
+        return greeks
+
+
+if __name__ == "__main__":
+    ''' Test implementation. '''
+    greeksEngine = BSMGreeks()
+    S = 50
+    K = 45
+    sigma = .3
+    r = .02
+    yte = 80/365
+
+    greeks = greeksEngine.computeGreeks(np.array([True, False]), sigma, yte, S, K, r)
+    for greekName, values in greeks.items():
+        print(f"{greekName}: call {values[0]:.6f}, put {values[1]:.6f}")
@@ -1,5 +1,7 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+
 import numpy as np
-import scipy.stats
+from scipy.special import erfcx, ndtri
 
 from src.BlackScholesMerton import BlackScholesMerton
 
@@ -25,12 +27,62 @@ class BSMRootFinder:
 
     '''
 
-    def __init__(me):
-        me.bs = BlackScholesMerton()
+    # Quote status codes, from .classifyQuotes()
+    QUOTE_OK = 0
+    QUOTE_BELOW_INTRINSIC = 1 # At or below the discounted intrinsic value; the IV would be 0 (or there's an arbitrage).
+    QUOTE_ABOVE_BOUND = 2 # At or above S for a call, or the discounted strike for a put; no finite IV gets there.
+    QUOTE_ZERO_TIME = 3 # Expired (or expiring now); the price doesn't depend on volatility.
+    QUOTE_INVALID = 4 # Missing (NaN) or non-positive price, underlying price, or strike.
+    QUOTE_STATUS_NAMES = {QUOTE_OK: 'ok', QUOTE_BELOW_INTRINSIC: 'below intrinsic', QUOTE_ABOVE_BOUND: 'above bound',
+                          QUOTE_ZERO_TIME: 'zero time', QUOTE_INVALID: 'invalid'}
+    # Solver status codes, from .getBSIVResults(): QUOTE_OK if the IV converged, the quote's status code if it was skipped, or:
+    IV_NOT_CONVERGED = 5 # Hit maxIters before the price was within testEpsilon.
+    IV_STATUS_NAMES = {**QUOTE_STATUS_NAMES, IV_NOT_CONVERGED: 'not converged'}
 
+    # .getBSIVRational(): contracts whose total volatility is still moving by more than this (relative) after householderSteps
+    # get up to RATIONAL_MAX_EXTRA_STEPS more (safeguarded) steps.
+    RATIONAL_RELATIVE_TOLERANCE = 1e-13
+    RATIONAL_MAX_EXTRA_STEPS = 60
 
+    def __init__(me, normKernel: str = 'ndtr'):
+        ''' :param normKernel: see BlackScholesMerton.__init__() '''
+        me.bs = BlackScholesMerton(normKernel=normKernel)
 
-    def getBSIV(me, currentPrice: float, type: str, yte: float, S: float, K: int, r: float, initialIVGuess: float = 1):
+    def classifyQuotes(me, currentPrices, isCall, yte, S, K, r, contractTerms: dict = None):
+        '''
+        Vectorized check of each quote against the no-arbitrage bounds of a European option (no dividends):
+            - call: max(S - Ke^(-rt), 0) < price < S
+            - put: max(Ke^(-rt) - S, 0) < price < Ke^(-rt)
+        Only quotes strictly inside the bounds have an IV; for anything else, a root finder can only run to maxIters
+        and return the edge of its bracket, so the IV solvers skip them (see .getBSIVArray()).
+
+        Stale quotes are the usual cause, e.g., a deep ITM call's midpoint averaged over bars while the underlying moved.
+
+        :param contractTerms: optional, from BlackScholesMerton.computeContractTerms(yte, S, K, r), with the broadcast shape of the inputs.
+        :return: int8 array of QUOTE_* status codes, with the broadcast shape of the inputs.
+        '''
+        currentPrices, isCall, yte, S, K, r = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                  np.asarray(yte, dtype=np.float64), np.asarray(S, dtype=np.float64),
+                                                                  np.asarray(K, dtype=np.float64), np.asarray(r, dtype=np.float64))
+        if contractTerms is None:
+            with np.errstate(all='ignore'):
+                contractTerms = me.bs.computeContractTerms(yte, S, K, r)
+        discountedK = np.broadcast_to(contractTerms['discountedK'], currentPrices.shape)
+        with np.errstate(invalid='ignore'):
+            lowerBound = np.maximum(np.where(isCall, S - discountedK, discountedK - S), 0)
+            upperBound = np.where(isCall, S, discountedK)
+            isInvalid = ~(np.isfinite(currentPrices) & (currentPrices > 0) & np.isfinite(S) & (S > 0) & np.isfinite(K) & (K > 0) & np.isfinite(r))
+            status = np.full(currentPrices.shape, me.QUOTE_OK, dtype=np.int8)
+            status[currentPrices >= upperBound] = me.QUOTE_ABOVE_BOUND
+            status[currentPrices <= lowerBound] = me.QUOTE_BELOW_INTRINSIC
+            status[~(yte > 0)] = me.QUOTE_ZERO_TIME
+            status[isInvalid] = me.QUOTE_INVALID
+        return status
+
+
+
+    def getBSIV(me, currentPrice: float, type: str, yte: float, S: float, K: int, r: float, initialIVGuess: float = 1, method: str = 'bisection',
+                priorIV: float = None):
         '''
         :param currentPrice: current price of option
         :param type: "P" or "C" (put/call)
@@ -41,8 +93,17 @@ class BSMRootFinder:
         :param initialIVGuess: first guess at what the IV is; defaults to 5,000%
             Default value is 5,000% because it seems to be about the max volatility that makes a different to Black-Scholes.
             We need to make sure it will always be greater than the IV we're looking for.
-        :return: 
+        :param method: 'bisection' (default), 'newton', 'halley', or 'rational'; anything but bisection goes through .getBSIVArray(), see there.
+        :param priorIV: optional, e.g., this contract's IV from the last time it was solved; if given, the search is warm started
+            from it, through .getBSIVArray() (see priorIVs there).
+        :return: the IV, or NaN if the price is outside of the no-arbitrage bounds (see .classifyQuotes()), or the search didn't converge.
+            Use .getBSIVResults() to find out why.
         '''
+        if method != 'bisection' or priorIV is not None:
+            ivResults = me.getBSIVResults(currentPrice, type == 'C', yte, S, K, r, initialIVGuess=initialIVGuess, method=method, priorIVs=priorIV)
+            return round(float(ivResults['iv']), 5) if ivResults['converged'] else np.nan
+        if me.classifyQuotes(currentPrice, type == 'C', yte, S, K, r) != me.QUOTE_OK:
+            return np.nan # No IV gets to this price; see .classifyQuotes().
         testEpsilon = 1e-4 # We want to be accurate to within 1/100th of $0.01
         sigmaGuess = initialIVGuess
         estimatedPrice = me.bs.priceOption(type, sigmaGuess, yte, S, K, r)
@@ -76,13 +137,470 @@ class BSMRootFinder:
             '''
             iterations += 1
         #print(f"IV found in {iterations} iterations.")
+        if np.abs(testResult) > testEpsilon:
+            return np.nan # Hit maxIters; sigmaGuess is wherever the bracket ended up, not an IV.
         return round(sigmaGuess,5)
 
+    def getBSIVArray(me, currentPrices, isCall, yte, S, K, r, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100, method: str = 'bisection',
+                     contractTerms: dict = None, priorIVs=None, priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Vectorized version of .getBSIV(); runs the root find on every contract at once.
+
+        All parameters may be NumPy arrays or scalars, as long as they broadcast together.
+        Each contract keeps its own [sigmaLow, sigmaHigh] bracket, and once a contract's price is within testEpsilon
+        it drops out of the active set, so later iterations only price the contracts that haven't converged yet.
+
+        method selects how the next guess is made:
+            - 'bisection': midpoint of the bracket (same as .getBSIV())
+            - 'newton': Newton-Raphson step using the analytic vega
+            - 'halley': Halley step using the analytic vega and vomma
+            - 'rational': hands off to .getBSIVRational(), which ignores the bracket, testEpsilon and maxIters.
+        Newton and Halley steps are safeguarded by the bisection bracket: if a step lands outside of (sigmaLow, sigmaHigh),
+        or vega is too small to divide by, that contract takes a bisection step instead.
+        This way they can never do worse than bisection, and usually need 3-5 iterations instead of 17-30.
+
+        The sigma-independent parts of the price (BlackScholesMerton.computeContractTerms()) are computed once up front,
+        and reused by every iteration; only the CDFs (and pdf, for vega) are recomputed.
+        If the caller already has them (e.g., to reuse them for Greeks afterwards), they can be passed in as contractTerms.
+
+        Quotes outside of the no-arbitrage bounds (see .classifyQuotes()) can't converge, and would just use up maxIters,
+        so unless skipInvalidQuotes is False, they're never put in the active set, and come back as NaN.
+
+        Warm starts: when the surface is rebuilt over and over, each contract's last IV (or a neighbouring contract's) is a much better
+        starting point than initialIVGuess. Contracts with a prior (finite and > 0 in priorIVs) start from it, with a tight bracket,
+        [prior/(1 + priorBracketWidth), prior*(1 + priorBracketWidth)], instead of [1e-6, initialIVGuess].
+        The ends of that bracket haven't been priced, so they aren't trusted: when a contract would bisect toward an end that hasn't been checked,
+        it prices that end instead. If the root turns out to be past it, the bracket moves out in that direction (the old end becomes the other end),
+        by a factor that squares each time, until the root is bracketed, or the bracket reaches 1e-6 or maxIV (10, or initialIVGuess if that's higher).
+        So a good prior doesn't cost any extra pricing (a Newton step from it usually lands inside the bracket, and never needs the ends),
+        and a bad one is still bracketed in a few steps.
+        Contracts without a prior (NaN, or <= 0) start cold, from [1e-6, initialIVGuess]. initialIVGuess is treated the same way as a prior's
+        upper end, so a cold contract whose IV is above it grows its bracket the same way. A prior only changes how many iterations a contract takes,
+        not whether it converges.
+
+        :param currentPrices: current prices of the options
+        :param isCall: boolean (or 0/1 int) mask; True/1 for calls, False/0 for puts.
+        :param yte: years to expiration
+        :param S: current price of underlying
+        :param K: strike of option
+        :param r: risk-free rate
+        :param initialIVGuess: first guess at what the IV is, also the initial upper bound of a cold bracket (see above)
+        :param method: 'bisection', 'newton', 'halley', or 'rational'
+        :param contractTerms: optional, from BlackScholesMerton.computeContractTerms(yte, S, K, r), with the broadcast shape of the inputs.
+        :param priorIVs: optional, per contract starting IVs (broadcast with the other inputs); ignored by 'rational', which doesn't iterate from a guess.
+        :param priorBracketWidth: sets the size of the initial bracket around a prior (see above).
+        :param skipInvalidQuotes: if False, every quote is solved, and invalid ones return whichever end of the bracket they ran into.
+        :return: float64 array of IVs (not rounded), with the broadcast shape of the inputs.
+            Contracts that hit maxIters keep their last guess; see .getBSIVResults() to tell them apart.
+        '''
+        return me.getBSIVResults(currentPrices, isCall, yte, S, K, r, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, maxIters=maxIters,
+                                 method=method, contractTerms=contractTerms, priorIVs=priorIVs, priorBracketWidth=priorBracketWidth,
+                                 skipInvalidQuotes=skipInvalidQuotes)['iv']
+
+    def getBSIVResults(me, currentPrices, isCall, yte, S, K, r, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100,
+                       method: str = 'bisection', contractTerms: dict = None, priorIVs=None, priorBracketWidth: float = 0.05,
+                       skipInvalidQuotes: bool = True):
+        '''
+        Same as .getBSIVArray() (see there for the parameters), but also returns how each contract's search went,
+        as a dict of arrays, each with the broadcast shape of the inputs:
+            - 'iv': float64 IVs (not rounded); NaN for skipped quotes, and the last guess for contracts that didn't converge
+            - 'converged': bool, True if the price at 'iv' is within testEpsilon of the quote
+            - 'iterations': int32, number of times the contract was priced (0 if skipped; householderSteps for 'rational', not counting extra steps)
+            - 'priceError': float64, price at 'iv' minus the quote (NaN if skipped)
+            - 'status': int8 IV_STATUS_NAMES code; QUOTE_OK if converged, else the reason it didn't
+        '''
+        if method == 'rational':
+            return me._getBSIVRationalResults(currentPrices, isCall, yte, S, K, r, testEpsilon, contractTerms=contractTerms)
+        if method not in ('bisection', 'newton', 'halley'):
+            raise ValueError(f"Unknown IV solver method: '{method}'")
+        minVega = 1e-10 # Below this, a Newton step is meaningless (deep ITM/OTM, or almost no time left).
+        minIV = 1e-6
+        maxIV = max(initialIVGuess, 10.0) # Any contract's bracket can grow up to here, whether it starts cold or warm.
+        currentPrices, isCall, yte, S, K, r = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                  np.asarray(yte, dtype=np.float64), np.asarray(S, dtype=np.float64),
+                                                                  np.asarray(K, dtype=np.float64), np.asarray(r, dtype=np.float64))
+        shape = currentPrices.shape
+        currentPrices, isCall, yte, S, K, r = (x.ravel() for x in (currentPrices, isCall, yte, S, K, r))
+        if contractTerms is None:
+            contractTerms = me.bs.computeContractTerms(yte, S, K, r)
+        else:
+            contractTerms = {key: np.broadcast_to(value, shape).ravel() for key, value in contractTerms.items()}
+        sigmaGuess = np.full(currentPrices.size, initialIVGuess, dtype=np.float64)
+        sigmaLow = np.full(currentPrices.size, minIV) # Can't be 0, or we'll get a division by zero error
+        sigmaHigh = sigmaGuess.copy()
+        # Only ends that have been priced (or are at minIV/maxIV) are trusted; the others are checked as needed (see above).
+        # For cold contracts that's initialIVGuess, so a root above it is still found, as it would be from a prior.
+        lowChecked = np.ones(currentPrices.size, dtype=bool)
+        highChecked = sigmaHigh >= maxIV
+        bracketGrowth = np.full(currentPrices.size, 1 + priorBracketWidth)
+        if priorIVs is not None:
+            priorIVs = np.broadcast_to(np.asarray(priorIVs, dtype=np.float64), shape).ravel()
+            warm = np.nonzero(np.isfinite(priorIVs) & (priorIVs > 0))[0]
+            sigmaGuess[warm] = np.clip(priorIVs[warm], minIV, maxIV)
+            sigmaLow[warm] = np.maximum(sigmaGuess[warm]/(1 + priorBracketWidth), minIV)
+            sigmaHigh[warm] = np.minimum(sigmaGuess[warm]*(1 + priorBracketWidth), maxIV)
+            lowChecked[warm] = sigmaLow[warm] <= minIV
+            highChecked[warm] = sigmaHigh[warm] >= maxIV
+        active = np.arange(currentPrices.size) # Indices of the contracts that still need work
+        quoteStatus = me.classifyQuotes(currentPrices, isCall, yte, S, K, r, contractTerms=contractTerms)
+        if skipInvalidQuotes:
+            active = np.nonzero(quoteStatus == me.QUOTE_OK)[0]
+            sigmaGuess[quoteStatus != me.QUOTE_OK] = np.nan
+        iterationCounts = np.zeros(currentPrices.size, dtype=np.int32)
+        priceErrors = np.full(currentPrices.size, np.nan)
+        guess = sigmaGuess[active]
+        iterations = 0
+        while active.size > 0 and iterations < maxIters:
+            low = sigmaLow[active]
+            high = sigmaHigh[active]
+            sigmaGuess[active] = guess
+            activeTerms = me.bs.selectContractTerms(contractTerms, active)
+            d1 = me.bs.computeD1FromTerms(guess, activeTerms)
+            testResult = me.bs.priceOptionsFromTerms(isCall[active], guess, activeTerms, d1=d1) - currentPrices[active]
+            # An unchecked end that was just priced and is on the wrong side of the root: move the bracket out past it.
+            rootBelowLow = (testResult > 0) & (guess <= low) & ~lowChecked[active]
+            rootAboveHigh = (testResult < 0) & (guess >= high) & ~highChecked[active]
+            # Same bracket update as .getBSIV(): too high -> new upper bound, too low -> new lower bound.
+            high = np.where(testResult > 0, guess, high)
+            low = np.where(testResult < 0, guess, low)
+            if rootBelowLow.any() or rootAboveHigh.any():
+                growth = bracketGrowth[active]
+                growth = np.where(rootBelowLow | rootAboveHigh, growth**2, growth)
+                bracketGrowth[active] = growth
+                low = np.where(rootBelowLow, np.maximum(guess/growth, minIV), low)
+                high = np.where(rootAboveHigh, np.minimum(guess*growth, maxIV), high)
+            lowChecked[active] |= (testResult < 0) | (low <= minIV)
+            highChecked[active] |= (testResult > 0) | (high >= maxIV)
+            sigmaHigh[active] = high
+            sigmaLow[active] = low
+            iterationCounts[active] += 1
+            priceErrors[active] = testResult
+            notConverged = np.abs(testResult) > testEpsilon
+            active = active[notConverged]
+            iterations += 1
+            guess, testResult, low, high, d1 = guess[notConverged], testResult[notConverged], low[notConverged], high[notConverged], d1[notConverged]
+            if method == 'bisection':
+                useBisection = np.ones(active.size, dtype=bool)
+                nextGuess = guess
+            else:
+                # Same as .getBSVega() and .getBSVomma(), but reusing d1 and sqrt(t) from pricing.
+                sqrtYte = activeTerms['sqrtYte'][notConverged]
+                vega = S[active]*me.bs.normPdf(d1)*sqrtYte
+                with np.errstate(all='ignore'):
+                    if method == 'newton':
+                        nextGuess = guess - testResult/vega
+                    else:
+                        vomma = vega*d1*(d1 - guess*sqrtYte)/guess
+                        nextGuess = guess - 2*testResult*vega/(2*vega**2 - testResult*vomma)
+                useBisection = (vega < minVega) | ~(nextGuess > low) | ~(nextGuess < high) # the ~ catches NaNs too
+            guess = np.where(useBisection, (low + high) / 2.0, nextGuess)
+            # Don't bisect toward an end that hasn't been checked; price it instead.
+            guess = np.where(useBisection & (testResult > 0) & ~lowChecked[active], low, guess)
+            guess = np.where(useBisection & (testResult < 0) & ~highChecked[active], high, guess)
+        return me._packIVResults(sigmaGuess, iterationCounts, priceErrors, quoteStatus, testEpsilon, shape)
+
+    def _packIVResults(me, ivs, iterationCounts, priceErrors, quoteStatus, testEpsilon: float, shape: tuple):
+        ''' Builds .getBSIVResults()'s dict from flat arrays. '''
+        status = quoteStatus.astype(np.int8).copy()
+        status[(status == me.QUOTE_OK) & ~(np.abs(priceErrors) <= testEpsilon)] = me.IV_NOT_CONVERGED # the ~ catches NaNs too
+        return {'iv': ivs.reshape(shape), 'converged': (status == me.QUOTE_OK).reshape(shape), 'iterations': iterationCounts.reshape(shape),
+                'priceError': priceErrors.reshape(shape), 'status': status.reshape(shape)}
+
+    def _getBSIVRationalResults(me, currentPrices, isCall, yte, S, K, r, testEpsilon: float, householderSteps: int = 3, contractTerms: dict = None):
+        '''
+        .getBSIVResults() for the 'rational' method: the IVs from .getBSIVRational(), repriced once to get their errors.
+        Valid quotes it can't resolve (NaN) are solved with the 'halley' method instead.
+        If contractTerms are passed in, the IVs come from .getBlack76IVRational(), with their forwards and discount factors.
+        '''
+        currentPrices, isCall, yte, S, K, r = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                  np.asarray(yte, dtype=np.float64), np.asarray(S, dtype=np.float64),
+                                                                  np.asarray(K, dtype=np.float64), np.asarray(r, dtype=np.float64))
+        shape = currentPrices.shape
+        currentPrices, isCall, yte, S, K, r = (x.ravel() for x in (currentPrices, isCall, yte, S, K, r))
+        if contractTerms is None:
+            ivs = me.getBSIVRational(currentPrices, isCall, yte, S, K, r, householderSteps=householderSteps)
+            with np.errstate(all='ignore'):
+                contractTerms = me.bs.computeContractTerms(yte, S, K, r)
+        else:
+            contractTerms = {key: np.broadcast_to(value, shape).ravel() for key, value in contractTerms.items()}
+            ivs = me.getBlack76IVRational(currentPrices, isCall, yte, contractTerms['forward'], K, contractTerms['discountFactor'],
+                                          householderSteps=householderSteps)
+        quoteStatus = me.classifyQuotes(currentPrices, isCall, yte, S, K, r, contractTerms=contractTerms)
+        iterationCounts = np.where(np.isfinite(ivs), householderSteps, 0).astype(np.int32)
+        # Quotes inside the bounds, but with so little time value that it's lost to rounding in the normalized price (e.g., deep ITM, with
+        # about an ulp of time value), come back NaN; the bracketed solver can still find an IV that reprices them within testEpsilon.
+        unresolved = np.nonzero(np.isnan(ivs) & (quoteStatus == me.QUOTE_OK))[0]
+        if unresolved.size > 0:
+            fallbackResults = me.getBSIVResults(currentPrices[unresolved], isCall[unresolved], yte[unresolved], S[unresolved], K[unresolved], r[unresolved],
+                                                testEpsilon=testEpsilon, method='halley',
+                                                contractTerms=me.bs.selectContractTerms(contractTerms, unresolved))
+            ivs[unresolved] = fallbackResults['iv']
+            iterationCounts[unresolved] = fallbackResults['iterations']
+        solved = np.isfinite(ivs)
+        with np.errstate(all='ignore'):
+            priceErrors = np.where(solved, me.bs.priceOptionsFromTerms(isCall, np.where(solved, ivs, 1.0), contractTerms) - currentPrices, np.nan)
+        return me._packIVResults(ivs, iterationCounts, priceErrors, quoteStatus, testEpsilon, shape)
+
+    def getBlack76IVArray(me, currentPrices, isCall, yte, F, K, discountFactor, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100,
+                          method: str = 'bisection', priorIVs=None, priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Black-76 version of .getBSIVArray(): IVs from each contract's forward and discount factor, instead of spot and r
+        (see BlackScholesMerton.computeForwardContractTerms()), e.g., for options on futures, or on an index with an implied forward.
+        :return: float64 array of IVs (not rounded), with the broadcast shape of the inputs.
+        '''
+        return me.getBlack76IVResults(currentPrices, isCall, yte, F, K, discountFactor, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon,
+                                      maxIters=maxIters, method=method, priorIVs=priorIVs, priorBracketWidth=priorBracketWidth,
+                                      skipInvalidQuotes=skipInvalidQuotes)['iv']
+
+    def getBlack76IVResults(me, currentPrices, isCall, yte, F, K, discountFactor, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100,
+                            method: str = 'bisection', priorIVs=None, priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Black-76 version of .getBSIVResults(); every method runs the same vectorized solver, on the forward contract terms.
+        :param F: forward (e.g., the futures price)
+        :param discountFactor: e^(-rt)
+        '''
+        contractTerms = me.bs.computeForwardContractTerms(yte, F, K, discountFactor)
+        return me.getBSIVResults(currentPrices, isCall, contractTerms['yte'], contractTerms['S'], contractTerms['K'], contractTerms['r'],
+                                 initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, maxIters=maxIters, method=method, contractTerms=contractTerms,
+                                 priorIVs=priorIVs, priorBracketWidth=priorBracketWidth, skipInvalidQuotes=skipInvalidQuotes)
+
+    def getBSIVArrayParallel(me, currentPrices, isCall, yte, S, K, r, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100,
+                             method: str = 'bisection', numWorkers: int = None, chunkSize: int = 1024, executor: Executor = None, priorIVs=None,
+                             priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Parallel version of .getBSIVArray(); see .getBSIVResultsParallel().
+        :return: float64 array of IVs (not rounded), with the broadcast shape of the inputs.
+        '''
+        return me.getBSIVResultsParallel(currentPrices, isCall, yte, S, K, r, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, maxIters=maxIters,
+                                         method=method, numWorkers=numWorkers, chunkSize=chunkSize, executor=executor, priorIVs=priorIVs,
+                                         priorBracketWidth=priorBracketWidth, skipInvalidQuotes=skipInvalidQuotes)['iv']
+
+    def getBSIVResultsParallel(me, currentPrices, isCall, yte, S, K, r, initialIVGuess: float = 1, testEpsilon: float = 1e-4, maxIters: int = 100,
+                               method: str = 'bisection', numWorkers: int = None, chunkSize: int = 1024, executor: Executor = None, priorIVs=None,
+                               priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Same as .getBSIVResults(), but the contracts are split into chunks of chunkSize, and the chunks are solved across a process pool.
+        Results come back in the same order (and shape) as the inputs.
+
+        Each chunk is still solved with the vectorized solver, so chunkSize should be big enough (hundreds to thousands)
+        that the per-chunk pickling and process overhead doesn't dominate.
+
+        :param numWorkers: number of worker processes; None uses os.cpu_count(). Ignored if executor is passed in.
+        :param chunkSize: number of contracts per task sent to a worker
+        :param executor: optional, an already running concurrent.futures Executor, so that the pool can be reused across calls
+            (e.g., across underlyings, or every time the surface is rebuilt), rather than paying for process startup every time.
+        :param priorIVs: optional, see .getBSIVArray(); split into chunks along with the other inputs.
+        :param priorBracketWidth: see .getBSIVArray()
+        :param skipInvalidQuotes: see .getBSIVArray()
+        :return: dict of arrays (see .getBSIVResults()), with the broadcast shape of the inputs.
+        '''
+        return me._getIVResultsParallel(currentPrices, isCall, yte, S, K, r, initialIVGuess, testEpsilon, maxIters, method, numWorkers, chunkSize, executor,
+                                        priorIVs, priorBracketWidth, skipInvalidQuotes, forwardBased=False)
+
+    def getBlack76IVResultsParallel(me, currentPrices, isCall, yte, F, K, discountFactor, initialIVGuess: float = 1, testEpsilon: float = 1e-4,
+                                    maxIters: int = 100, method: str = 'bisection', numWorkers: int = None, chunkSize: int = 1024,
+                                    executor: Executor = None, priorIVs=None, priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        ''' Black-76 version of .getBSIVResultsParallel(); see .getBlack76IVResults(). '''
+        return me._getIVResultsParallel(currentPrices, isCall, yte, F, K, discountFactor, initialIVGuess, testEpsilon, maxIters, method, numWorkers,
+                                        chunkSize, executor, priorIVs, priorBracketWidth, skipInvalidQuotes, forwardBased=True)
+
+    def _getIVResultsParallel(me, currentPrices, isCall, yte, S, K, r, initialIVGuess: float, testEpsilon: float, maxIters: int, method: str,
+                              numWorkers: int, chunkSize: int, executor: Executor, priorIVs, priorBracketWidth: float, skipInvalidQuotes: bool,
+                              forwardBased: bool):
+        ''' Shared by .getBSIVResultsParallel() and .getBlack76IVResultsParallel(); if forwardBased, S and r are the forwards and discount factors. '''
+        currentPrices, isCall, yte, S, K, r = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                  np.asarray(yte, dtype=np.float64), np.asarray(S, dtype=np.float64),
+                                                                  np.asarray(K, dtype=np.float64), np.asarray(r, dtype=np.float64))
+        shape = currentPrices.shape
+        flatInputs = [x.ravel() for x in (currentPrices, isCall, yte, S, K, r)]
+        numContracts = flatInputs[0].size
+        if priorIVs is not None:
+            priorIVs = np.broadcast_to(np.asarray(priorIVs, dtype=np.float64), shape).ravel()
+        chunkArgs = [(tuple(x[start:start + chunkSize] for x in flatInputs), initialIVGuess, testEpsilon, maxIters, method, me.bs.normKernel,
+                      None if priorIVs is None else priorIVs[start:start + chunkSize], priorBracketWidth, skipInvalidQuotes, forwardBased)
+                     for start in range(0, numContracts, chunkSize)]
+        if len(chunkArgs) == 0:
+            getIVResults = me.getBlack76IVResults if forwardBased else me.getBSIVResults
+            ivResults = getIVResults(*flatInputs, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, maxIters=maxIters, method=method,
+                                     priorBracketWidth=priorBracketWidth, skipInvalidQuotes=skipInvalidQuotes)
+            return {name: ivResult.reshape(shape) for name, ivResult in ivResults.items()}
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=numWorkers) as ownExecutor:
+                chunkResults = list(ownExecutor.map(_getBSIVChunk, chunkArgs))
+        else:
+            chunkResults = list(executor.map(_getBSIVChunk, chunkArgs)) # .map() returns results in submission order.
+        return {name: np.concatenate([ivResults[name] for ivResults in chunkResults]).reshape(shape) for name in chunkResults[0]}
+
+    def getBSIVRational(me, currentPrices, isCall, yte, S, K, r, householderSteps: int = 3):
+        '''
+        Fixed-cost, high accuracy IV engine, in the spirit of Jaeckel's "Let's Be Rational".
+        See: http://www.jaeckel.org/LetsBeRational.pdf
+
+        Instead of iterating until some tolerance is hit, every contract gets the same work:
+        an initial guess from a closed-form approximation, then householderSteps third-order Householder steps.
+        There are no per-contract branches (everything is np.where), so the cost of a chain is predictable.
+        Every step is safeguarded by a bracket on the root (see ._getRationalStep()), so a poor initial guess can't send s negative or to NaN;
+        the few contracts that are still moving after householderSteps (usually after a safeguard step) get more steps, on their own.
+
+        Everything is done on the *normalized* Black price, b(x, s), where
+            - x = ln(F/K), with F = Se^(rt) the forward
+            - s = sigma*sqrt(t), the total volatility
+            - b = (undiscounted price)/sqrt(FK)
+        Put-call parity and the symmetry b_put(x) = b_call(-x) reduce every contract to an out-of-the-money call with x <= 0.
+        That call's price is convex in s below s_c = sqrt(2|x|), and concave above it, so:
+            - Below b_c = b(x, s_c) (the deep OTM/short dated "lower" region), the objective is ln(b(s)) - ln(b), which is close to linear in 1/s^2.
+              The initial guess fits ln(b) = A - B/s^2 through b_c and its slope at s_c.
+            - Above b_c, the objective is just b(s) - b, and the initial guess comes from
+              e^(x/2) - b ~= (e^(x/2) + e^(-x/2))N(-s/2), which is exact at the money.
+        For most contracts, with this guess, 3 steps gets within a few ulps of the normalized price, as long as the price itself is representable
+        (the normalized price uses erfcx to avoid cancellation, which still loses some digits when s^2 << |x|).
+
+        Contracts that are at or below intrinsic, above the forward, or have no time left come back as NaN
+        (the same quotes .classifyQuotes() flags, since the bounds on the normalized price are the same bounds).
+
+        :param currentPrices: current prices of the options
+        :param isCall: boolean (or 0/1 int) mask; True/1 for calls, False/0 for puts.
+        :param yte: years to expiration
+        :param S: current price of underlying
+        :param K: strike of option
+        :param r: risk-free rate
+        :param householderSteps: number of Householder steps after the initial guess
+        :return: float64 array of IVs (not rounded), with the broadcast shape of the inputs.
+        '''
+        currentPrices, isCall, yte, S, K, r = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                  np.asarray(yte, dtype=np.float64), np.asarray(S, dtype=np.float64),
+                                                                  np.asarray(K, dtype=np.float64), np.asarray(r, dtype=np.float64))
+        with np.errstate(all='ignore'):
+            x = np.log(S/K) + r*yte
+            beta = currentPrices*np.exp(r*yte)/np.sqrt(S*np.exp(r*yte)*K)
+        return me._getNormalizedIVRational(x, beta, isCall, yte, householderSteps)
+
+    def getBlack76IVRational(me, currentPrices, isCall, yte, F, K, discountFactor, householderSteps: int = 3):
+        '''
+        Black-76 version of .getBSIVRational(), from each contract's forward and discount factor;
+        the normalized price is already in terms of the forward, so this just skips the spot -> forward step.
+        :return: float64 array of IVs (not rounded), with the broadcast shape of the inputs.
+        '''
+        currentPrices, isCall, yte, F, K, discountFactor = np.broadcast_arrays(np.asarray(currentPrices, dtype=np.float64), np.asarray(isCall, dtype=bool),
+                                                                               np.asarray(yte, dtype=np.float64), np.asarray(F, dtype=np.float64),
+                                                                               np.asarray(K, dtype=np.float64), np.asarray(discountFactor, dtype=np.float64))
+        with np.errstate(all='ignore'):
+            x = np.log(F/K)
+            beta = currentPrices/discountFactor/np.sqrt(F*K)
+        return me._getNormalizedIVRational(x, beta, isCall, yte, householderSteps)
+
+    def _getNormalizedIVRational(me, x, beta, isCall, yte, householderSteps: int):
+        ''' The rest of .getBSIVRational(), from x = ln(F/K) and beta = (undiscounted price)/sqrt(FK). '''
+        with np.errstate(all='ignore'):
+            # Move ITM contracts to the OTM side by subtracting (normalized) intrinsic value.
+            theta = np.where(isCall, 1.0, -1.0)
+            beta = beta - np.maximum(theta*(np.exp(x/2) - np.exp(-x/2)), 0)
+            x = -np.abs(x)
+            bMax = np.exp(x/2)
+            isValid = (beta > 0) & (beta < bMax) & (yte > 0)
+            beta = np.where(isValid, beta, bMax/2) # Keep the math quiet for invalid contracts; they're NaN'd at the end.
+
+            # Split into lower/upper regions at the inflection point s_c.
+            sc = np.sqrt(2*np.abs(x))
+            scSafe = np.where(sc > 0, sc, 1)
+            bc = np.where(sc > 0, me._normalizedBlackCall(x, scSafe), 0)
+            isLower = beta < bc
+            logBeta = np.log(beta)
+            curvatureB = me._normalizedBlackVega(x, scSafe)/bc*scSafe**3/2
+            curvatureA = np.log(bc) + curvatureB/scSafe**2
+            sLower = np.sqrt(curvatureB/(curvatureA - logBeta))
+            sUpper = -2*ndtri((bMax - beta)/(bMax + np.exp(-x/2)))
+            s = np.where(isLower, sLower, sUpper)
+            s = np.where(np.isfinite(s) & (s > 0), s, scSafe)
+
+            # The objective is increasing in s, so every step also narrows a bracket on the root: (0, s_c) in the lower region,
+            # and (s_c, inf) in the upper one (see ._getRationalStep()). This keeps s positive, and keeps it from diverging
+            # when the initial guess is poor (e.g., short dated contracts near the money, where s^2 << |x|).
+            sLow = np.where(isLower, 0.0, np.where(sc > 0, sc, 0.0))
+            sHigh = np.where(isLower, scSafe, np.inf)
+            lastResidual = np.full(s.shape, np.inf)
+            converged = ~isValid
+            for _ in range(householderSteps):
+                s, sLow, sHigh, lastResidual, converged = me._getRationalStep(x, s, beta, logBeta, isLower, sLow, sHigh, lastResidual)
+            # Contracts that are still moving after householderSteps get up to RATIONAL_MAX_EXTRA_STEPS more, on their own.
+            active = np.nonzero((~converged & isValid).ravel())[0]
+            x, beta, logBeta, isLower = (np.broadcast_to(value, s.shape).ravel() for value in (x, beta, logBeta, isLower))
+            s, sLow, sHigh, lastResidual = (value.ravel().copy() for value in (s, sLow, sHigh, lastResidual))
+            for _ in range(me.RATIONAL_MAX_EXTRA_STEPS):
+                if active.size == 0:
+                    break
+                s[active], sLow[active], sHigh[active], lastResidual[active], converged = me._getRationalStep(
+                    x[active], s[active], beta[active], logBeta[active], isLower[active], sLow[active], sHigh[active], lastResidual[active])
+                active = active[~converged]
+            s = s.reshape(isValid.shape)
+            sigma = np.where(isValid, s/np.sqrt(yte), np.nan)
+        return sigma
+
+    def _getRationalStep(me, x, s, beta, logBeta, isLower, sLow, sHigh, lastResidual):
+        '''
+        One safeguarded Householder step for ._getNormalizedIVRational().
+        The objective is increasing in s, so the residual at s also narrows [sLow, sHigh]. A Householder step that lands outside of it
+        (or on NaN), or that follows a step that made the residual grow, is replaced by a Newton step,
+        or by a bisection step (geometric, since s can span orders of magnitude) if that's outside too.
+        :return: tuple (s, sLow, sHigh, |residual|, converged), converged where s moved by less than RATIONAL_RELATIVE_TOLERANCE.
+        '''
+        b = me._normalizedBlackCall(x, s)
+        vega = me._normalizedBlackVega(x, s)
+        # The second and third derivatives, divided by vega, have simple closed forms for the normalized price.
+        h2 = x*x/s**3 - s/4
+        h3 = h2*h2 - 3*x*x/s**4 - 0.25
+        # Lower region: g = ln(b) - ln(beta), with derivatives from the chain rule.
+        g1 = vega/b
+        g2 = g1*h2 - g1*g1
+        g3 = g1*h3 - 3*g1*g1*h2 + 2*g1**3
+        f = np.where(isLower, np.log(b) - logBeta, b - beta)
+        f1 = np.where(isLower, g1, vega)
+        f2 = np.where(isLower, g2/g1, h2)
+        f3 = np.where(isLower, g3/g1, h3)
+        sHigh = np.where(f > 0, np.minimum(sHigh, s), sHigh)
+        sLow = np.where(f < 0, np.maximum(sLow, s), sLow)
+        nu = -f/f1
+        sNext = s + nu*(1 + 0.5*f2*nu)/(1 + nu*(f2 + f3*nu/6))
+        sNext = np.where(~((sNext > sLow) & (sNext < sHigh)) | ~(np.abs(f) <= lastResidual), s + nu, sNext) # the ~ catches NaNs too
+        sBisect = np.where(sLow <= 0, sHigh/2, np.where(np.isinf(sHigh), 2*sLow, np.sqrt(sLow*sHigh)))
+        sNext = np.where((sNext > sLow) & (sNext < sHigh), sNext, sBisect)
+        sNext = np.where(f == 0, s, sNext)
+        return sNext, sLow, sHigh, np.abs(f), np.abs(sNext - s) <= me.RATIONAL_RELATIVE_TOLERANCE*s
+
+    def _normalizedBlackCall(me, x, s):
+        ''' Normalized Black call price b(x, s) (see .getBSIVRational()), written with erfcx to avoid cancellation when x < 0. '''
+        h = x/s
+        t = s/2
+        return 0.5*np.exp(-0.5*(h*h + t*t))*(erfcx(-(h + t)/np.sqrt(2)) - erfcx(-(h - t)/np.sqrt(2)))
+
+    def _normalizedBlackVega(me, x, s):
+        ''' db/ds of the normalized Black price; e^(x/2)N'(x/s + s/2) simplifies to this. '''
+        return np.exp(-0.5*(x*x/(s*s) + s*s/4))/np.sqrt(2*np.pi)
+
     def getBSVega(me, S, K, T, r, sigma):
-        # This is part of the code from StackOverflow that I used to verify the correctness of the above code.
-        # The rest is commented out with a note above.
-        d1 = ((np.log(S/K) + (r + 0.5 * sigma**2))*T)/(sigma * np.sqrt(T))
-        return S*scipy.stats.norm.pdf(d1)* np.sqrt(T)
+        '''
+        Analytic vega, dPrice/dSigma (the same for puts and calls).
+        This started as part of the code from StackOverflow that I used to verify the bisection code,
+        but T was inside the log term there; fixed here.
+        '''
+        d1 = me.bs.computeD1(sigma, T, S, K, r)
+        return S*me.bs.normPdf(d1)*np.sqrt(T)
+
+    def getBSVomma(me, S, K, T, r, sigma):
+        ''' Analytic vomma (volga), d^2Price/dSigma^2 = vega*d1*d2/sigma. Used for Halley steps. '''
+        d1 = me.bs.computeD1(sigma, T, S, K, r)
+        d2 = me.bs.computeD2FromD1(d1, sigma, T)
+        return S*me.bs.normPdf(d1)*np.sqrt(T)*d1*d2/sigma
+
+
+def _getBSIVChunk(chunkArgs):
+    ''' Worker for .getBSIVResultsParallel() (and the Black-76 version); has to be at module level so the process pool can pickle it. '''
+    ((currentPrices, isCall, yte, S, K, r), initialIVGuess, testEpsilon, maxIters, method, normKernel, priorIVs, priorBracketWidth, skipInvalidQuotes,
+     forwardBased) = chunkArgs
+    brf = BSMRootFinder(normKernel=normKernel)
+    getIVResults = brf.getBlack76IVResults if forwardBased else brf.getBSIVResults
+    return getIVResults(currentPrices, isCall, yte, S, K, r, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, maxIters=maxIters, method=method,
+                        priorIVs=priorIVs, priorBracketWidth=priorBracketWidth, skipInvalidQuotes=skipInvalidQuotes)
 
 
 if __name__ == "__main__":
@@ -108,6 +626,29 @@ if __name__ == "__main__":
     r = .0028
     calculatedIV = brf.getBSIV(optionValue, 'C', yte, S, K, r)
     print(f"Calculated IV: {calculatedIV * 100}% (Actual: ?)")
+    quoteStatus = int(brf.classifyQuotes(optionValue, True, yte, S, K, r))
+    print(f"Quote status: {brf.QUOTE_STATUS_NAMES[quoteStatus]} (intrinsic value: {S - K*np.exp(-r*yte):.4f})")
     sigma = .35 #calculatedIV
     optionValue = bsm.priceOption('C', sigma, yte, S, K, r)
     print(f"Calculated option value: {optionValue}")
+
+    # Vectorized: solve both of the above contracts in one call.
+    calculatedIVs = brf.getBSIVArray(np.array([bsm.priceOption('C', .3, 80/365, 50, 45, .02), 44.4]), True,
+                                     np.array([80/365, 0.0136986]), np.array([50, 179.495]), np.array([45, 135]), np.array([.02, .0028]))
+    print(f"Calculated IVs: {calculatedIVs*100}%")
+    for method in ('newton', 'halley', 'rational'):
+        calculatedIVs = brf.getBSIVArray(np.array([bsm.priceOption('C', .3, 80/365, 50, 45, .02), 44.4]), True,
+                                         np.array([80/365, 0.0136986]), np.array([50, 179.495]), np.array([45, 135]), np.array([.02, .0028]), method=method)
+        print(f"Calculated IVs ({method}): {calculatedIVs*100}%")
+    ivResults = brf.getBSIVResults(np.array([bsm.priceOption('C', .3, 80/365, 50, 45, .02), 44.4]), True,
+                                   np.array([80/365, 0.0136986]), np.array([50, 179.495]), np.array([45, 135]), np.array([.02, .0028]))
+    print(f"Iterations: {ivResults['iterations']}, price errors: {ivResults['priceError']}, "
+          f"statuses: {[brf.IV_STATUS_NAMES[status] for status in ivResults['status'].tolist()]}")
+
+    # Black-76: the same contracts, quoted on their forwards (e.g., options on futures).
+    ytes = np.array([80/365, 0.0136986])
+    rs = np.array([.02, .0028])
+    forwards = np.array([50, 179.495])*np.exp(rs*ytes)
+    calculatedIVs = brf.getBlack76IVArray(np.array([bsm.priceOption('C', .3, 80/365, 50, 45, .02), 44.4]), True, ytes, forwards, np.array([45, 135]),
+                                          np.exp(-rs*ytes), method='newton')
+    print(f"Calculated IVs (Black-76, newton): {calculatedIVs*100}%")
@@ -1,6 +1,5 @@
 import numpy as np
-import scipy.stats
-from scipy.stats import norm
+from scipy.special import ndtr
 
 
 class BlackScholesMerton:
@@ -44,8 +43,26 @@ class BlackScholesMerton:
             - Discount to curren value
     '''
 
-    def __init__(me):
-        pass
+    def __init__(me, normKernel: str = 'ndtr'):
+        '''
+        :param normKernel: which implementation of the normal CDF/PDF to use in the pricing hot path.
+            - 'ndtr' (default): scipy.special.ndtr ufunc for the CDF, and the PDF written out with np.exp.
+                No scipy.stats import, and no per-call distribution dispatch overhead.
+            - 'scipy.stats': scipy.stats.norm.cdf/.pdf, which is what was originally used. Slower, mostly useful for checking results.
+        '''
+        if normKernel == 'ndtr':
+            me.normCdf = ndtr
+            me.normPdf = me._ndtrPdf
+        elif normKernel == 'scipy.stats':
+            from scipy.stats import norm # Imported lazily, because importing scipy.stats is slow.
+            me.normCdf = norm.cdf
+            me.normPdf = norm.pdf
+        else:
+            raise ValueError(f"Unknown normal CDF/PDF kernel: '{normKernel}'")
+        me.normKernel = normKernel
+
+    def _ndtrPdf(me, x):
+        return np.exp(-0.5*x*x)/np.sqrt(2*np.pi)
 
     def priceOption(me, type: str, sigma, yte, S, K, r):
         '''
@@ -57,11 +74,104 @@ class BlackScholesMerton:
         #print(f"d1: {d1}, d2: {d2}")
         presentValue = 0
         if type == 'C':
-            presentValue = norm.cdf(d1)*S - norm.cdf(d2)*K*np.exp(-r*yte)
+            presentValue = me.normCdf(d1)*S - me.normCdf(d2)*K*np.exp(-r*yte)
         elif type == 'P':
-            presentValue = norm.cdf(-d2)*K*np.exp(-r*yte) - norm.cdf(-d1)*S
+            presentValue = me.normCdf(-d2)*K*np.exp(-r*yte) - me.normCdf(-d1)*S
         return round(presentValue, 4)
 
+    def priceOptions(me, isCall, sigma, yte, S, K, r):
+        '''
+        Vectorized version of .priceOption(), for pricing a whole chain (or several) in one pass.
+
+        All parameters may be NumPy arrays or scalars, as long as they broadcast together.
+        Unlike .priceOption(), the result is *not* rounded.
+
+        If the same contracts will be priced more than once (e.g., while solving for IV), use .computeContractTerms() once,
+        and then .priceOptionsFromTerms() for each sigma instead.
+
+        :param isCall: boolean (or 0/1 int) mask; True/1 for calls, False/0 for puts.
+        :return: float64 array of present values, with the broadcast shape of the inputs.
+        '''
+        return me.priceOptionsFromTerms(isCall, sigma, me.computeContractTerms(yte, S, K, r))
+
+    def computeContractTerms(me, yte, S, K, r):
+        '''
+        Computes everything in the price that doesn't depend on sigma, so it can be reused across
+        every iteration of an IV solve, and by the Greeks (see BSMGreeks).
+
+        The log, sqrt, and exp calls are the expensive part of pricing; only the CDFs depend on sigma.
+
+        :return: dict of float64 arrays (broadcast against each other), keyed by
+            'yte', 'S', 'K', 'r', 'logMoneyness' (ln(S/K)), 'logForwardMoneyness' (ln(F/K) = ln(S/K) + rt), 'sqrtYte',
+            'discountFactor' (e^(-rt)), 'discountedK' (Ke^(-rt)), and 'forward' (F = Se^(rt)).
+        '''
+        yte, S, K, r = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (yte, S, K, r)))
+        terms = {'yte': yte, 'S': S, 'K': K, 'r': r}
+        terms['logMoneyness'] = np.log(S/K)
+        terms['logForwardMoneyness'] = terms['logMoneyness'] + r*yte
+        terms['sqrtYte'] = np.sqrt(yte)
+        terms['discountFactor'] = np.exp(-r*yte)
+        terms['discountedK'] = K*terms['discountFactor']
+        terms['forward'] = S/terms['discountFactor']
+        return terms
+
+    def computeForwardContractTerms(me, yte, F, K, discountFactor):
+        '''
+        Black-76: the same terms as .computeContractTerms(), but from each contract's forward (e.g., the futures price, for options on futures,
+        or an index's implied forward) and discount factor, instead of spot and r. There's no spot to discount, and no carry to estimate.
+
+        Every function that takes contract terms (.priceOptionsFromTerms(), BSMRootFinder's solvers, BSMGreeks.computeGreeks()) then prices
+        with Black-76, through the same kernels:
+            C = D(N(d1)F - N(d2)K),  P = D(N(-d2)K - N(-d1)F),  d1 = (ln(F/K) + sigma^2 t/2)/(sigma sqrt(t))
+        This is Black-Scholes-Merton with S = DF and r = -ln(D)/t, so those are what 'S' and 'r' hold
+        (which means Greeks computed from these terms are with respect to DF, not F; e.g., dPrice/dF is delta*D).
+
+        :param discountFactor: D = e^(-rt), for whatever rate the options are discounted at.
+        '''
+        yte, F, K, discountFactor = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (yte, F, K, discountFactor)))
+        terms = {'yte': yte, 'S': F*discountFactor, 'K': K}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms['r'] = np.where(yte > 0, -np.log(discountFactor)/yte, 0.0)
+        terms['logForwardMoneyness'] = np.log(F/K)
+        terms['logMoneyness'] = terms['logForwardMoneyness'] - terms['r']*yte
+        terms['sqrtYte'] = np.sqrt(yte)
+        terms['discountFactor'] = discountFactor
+        terms['discountedK'] = K*discountFactor
+        terms['forward'] = F
+        return terms
+
+    def priceBlack76Options(me, isCall, sigma, yte, F, K, discountFactor):
+        '''
+        Vectorized Black-76 prices, e.g., for options on futures (see .computeForwardContractTerms()).
+        :return: float64 array of present values, with the broadcast shape of the inputs.
+        '''
+        return me.priceOptionsFromTerms(isCall, sigma, me.computeForwardContractTerms(yte, F, K, discountFactor))
+
+    def selectContractTerms(me, terms: dict, indices):
+        ''' Returns the terms for a subset of the contracts (e.g., the ones an IV solver is still working on). '''
+        return {key: value[indices] for key, value in terms.items()}
+
+    def computeD1FromTerms(me, sigma, terms: dict):
+        ''' Same as .computeD1(), using precomputed terms from .computeContractTerms(); the rt term is already in ln(F/K). '''
+        return (terms['logForwardMoneyness'] + (sigma**2/2)*terms['yte'])/(sigma*terms['sqrtYte'])
+
+    def priceOptionsFromTerms(me, isCall, sigma, terms: dict, d1=None):
+        '''
+        Same as .priceOptions(), using precomputed terms from .computeContractTerms() (or Black-76, from .computeForwardContractTerms()).
+        d1 can be passed in if it has already been computed (from .computeD1FromTerms()) for the same sigma.
+        '''
+        isCall = np.asarray(isCall, dtype=bool)
+        sigma = np.asarray(sigma, dtype=np.float64)
+        if d1 is None:
+            d1 = me.computeD1FromTerms(sigma, terms)
+        d2 = d1 - sigma*terms['sqrtYte']
+        # Put-call parity lets us price both rights with the same two CDF evaluations:
+        #   C = N(d1)S - N(d2)Ke^(-rt),  P = N(-d2)Ke^(-rt) - N(-d1)S = C - S + Ke^(-rt)
+        # Flipping the sign of d1 and d2 for puts (w = -1) gives the same result, without the cancellation.
+        w = np.where(isCall, 1.0, -1.0)
+        presentValue = w*(me.normCdf(w*d1)*terms['S'] - me.normCdf(w*d2)*terms['discountedK'])
+        return presentValue
+
 
     def computeD1(me, sigma, yte, S, K, r):
         return (np.log(S/K) + (r + (sigma**2/2))*yte)/(sigma*np.sqrt(yte))
@@ -89,5 +199,29 @@ if __name__ == "__main__":
     d2 = bsm.computeD2FromD1(d1, sigma, yte)
     #altD2 = bs.computeD2(sigma, yte, S, K, r)
     #print(f"D1: {d1}, D2: {d2}, altD2: {altD2}")
-    print(f"d1: {d1}, N(d1): {norm.cdf(d1)}, d2: {d2}, N(d2): {norm.cdf(d2)}")
-
+    print(f"d1: {d1}, N(d1): {bsm.normCdf(d1)}, d2: {d2}, N(d2): {bsm.normCdf(d2)}")
+
+    # Vectorized: price a call and a put on the same contract at once.
+    optionValues = bsm.priceOptions(np.array([True, False]), sigma, yte, S, K, r)
+    print(f"Call/put worth: {optionValues}")
+
+    # Check the fast normal CDF/PDF kernel against scipy.stats.norm across a range of contracts.
+    bsmStats = BlackScholesMerton(normKernel='scipy.stats')
+    rng = np.random.default_rng(0)
+    numContracts = 100000
+    isCalls = rng.random(numContracts) < .5
+    sigmas = rng.uniform(.01, 3, numContracts)
+    ytes = rng.uniform(1/365, 3, numContracts)
+    strikes = rng.uniform(.5*S, 2*S, numContracts)
+    maxPriceDiff = np.max(np.abs(bsm.priceOptions(isCalls, sigmas, ytes, S, strikes, r) - bsmStats.priceOptions(isCalls, sigmas, ytes, S, strikes, r)))
+    xs = np.linspace(-40, 40, 100001)
+    maxPdfDiff = np.max(np.abs(bsm.normPdf(xs) - bsmStats.normPdf(xs)))
+    print(f"Max price difference (ndtr vs. scipy.stats): {maxPriceDiff}, max pdf difference: {maxPdfDiff}")
+    assert maxPriceDiff < 1e-10 and maxPdfDiff < 1e-15
+
+    # Black-76, with the forward and discount factor that match the contracts above, gives the same prices.
+    forwards = S*np.exp(r*ytes)
+    maxBlack76Diff = np.max(np.abs(bsm.priceBlack76Options(isCalls, sigmas, ytes, forwards, strikes, np.exp(-r*ytes))
+                                   - bsm.priceOptions(isCalls, sigmas, ytes, S, strikes, r)))
+    print(f"Max price difference (Black-76 vs. Black-Scholes-Merton): {maxBlack76Diff}")
+    assert maxBlack76Diff < 1e-10
@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+
+from src.ChainBarStore import ChainBarStore
+
+
+class ChainBarCache(ChainBarStore):
+
+    '''
+    Memory-mapped version of the ChainBarStore: same columns and contract index, but each one is its own .npy file
+    in a directory per (symbol, snapshot date), and they're opened with np.load(mmap_mode='r').
+
+    Loading a chain doesn't read or unpickle anything up front; bars are paged in by the OS as they're touched,
+    and every process that maps the same files shares one copy of them in the page cache.
+    So parallel workers (e.g., IV workers in a process pool) can each open the cache by path, instead of each loading its own copy of the chain.
+
+    The arrays returned by .loadChain() are read-only views into the mapped files.
+    '''
+
+    def getPath(me, symbol: str, snapshotDate: str):
+        return os.path.join(me.basePath, f"{symbol}_{snapshotDate}_bars_mmap")
+
+    def saveChainArrays(me, symbol: str, snapshotDate: str, arrays: dict):
+        chainPath = me.getPath(symbol, snapshotDate)
+        os.makedirs(chainPath, exist_ok=True)
+        for name, array in arrays.items():
+            # Write to a temporary file and swap it in, so arrays still mapped from the old file stay valid.
+            columnPath = os.path.join(chainPath, f"{name}.npy")
+            np.save(columnPath + ".tmp.npy", array)
+            os.replace(columnPath + ".tmp.npy", columnPath)
+
+    def buildFromStore(me, store: ChainBarStore, symbol: str, snapshotDate: str):
+        ''' Builds the memory-mapped cache for a chain from its ChainBarStore file (one read of the .npz). '''
+        with np.load(store.getPath(symbol, snapshotDate)) as npz:
+            arrays = {name: npz[name] for name in me.BAR_COLUMNS + me.CONTRACT_COLUMNS}
+        me.saveChainArrays(symbol, snapshotDate, arrays)
+
+    def loadChain(me, symbol: str, snapshotDate: str, columns: tuple = ChainBarStore.BAR_COLUMNS, keys: list = None):
+        '''
+        :param columns: which bar columns to map; the others aren't opened.
+        :param keys: optional, only return these contracts.
+        :return: dict of key -> dict of column name -> read-only array, each a view into the memory-mapped column.
+        '''
+        contractIndex = me.loadContractIndex(symbol, snapshotDate)
+        columnArrays = {name: me._loadColumn(symbol, snapshotDate, name) for name in columns}
+        return me.splitChainArrays(contractIndex['contractKeys'], contractIndex['contractOffsets'], columnArrays, keys)
+
+    def loadContractIndex(me, symbol: str, snapshotDate: str):
+        # The index is small (one element per contract), so it's just read, not mapped.
+        return {name: np.load(os.path.join(me.getPath(symbol, snapshotDate), f"{name}.npy")) for name in me.CONTRACT_COLUMNS}
+
+    def _loadColumn(me, symbol: str, snapshotDate: str, name: str):
+        ''' Maps the column's .npy file (read-only) instead of reading it. '''
+        return np.load(os.path.join(me.getPath(symbol, snapshotDate), f"{name}.npy"), mmap_mode='r')
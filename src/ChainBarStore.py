@@ -0,0 +1,173 @@
+import glob
+import os
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from src.utils import loadObject
+
+
+class ChainBarStore:
+
+    '''
+    Columnar on-disk store for an option chain's bars: one .npz file per (symbol, snapshot date),
+    instead of one pickle per contract.
+
+    Every bar of every contract in the chain (and the underlying) is one row, and each field is its own column:
+        - 'date' (int64, seconds since the epoch, UTC), 'open', 'high', 'low', 'close', 'average' (float64), 'volume', 'barCount' (int64)
+    Rows are grouped by contract, sorted by (right, expiry, strike), and there is a contract index, one element per contract:
+        - 'contractKeys' (.getOCCKey() key, or the symbol for the underlying), 'contractRights' ('C', 'P', or '' for the underlying),
+          'contractExpiries' (datetime64[D], NaT for the underlying), 'contractStrikes' (NaN for the underlying)
+        - 'contractOffsets': contract i's bars are rows contractOffsets[i]:contractOffsets[i+1]
+
+    np.load() of an .npz only reads a column when it's accessed, so loading just the columns you need (e.g., only 'close')
+    skips the rest of the file.
+    '''
+
+    BAR_COLUMNS = ('date', 'open', 'high', 'low', 'close', 'volume', 'average', 'barCount')
+    CONTRACT_COLUMNS = ('contractKeys', 'contractRights', 'contractExpiries', 'contractStrikes', 'contractOffsets')
+
+    def __init__(me, basePath: str):
+        me.basePath = basePath
+
+    def getPath(me, symbol: str, snapshotDate: str):
+        ''' snapshotDate is a string like "2021-12-10" (the date the bars were downloaded). '''
+        return os.path.join(me.basePath, f"{symbol}_{snapshotDate}_bars.npz")
+
+    def hasChain(me, symbol: str, snapshotDate: str):
+        return os.path.exists(me.getPath(symbol, snapshotDate))
+
+    def saveChain(me, symbol: str, snapshotDate: str, barsByKey: dict):
+        '''
+        :param barsByKey: dict of key -> list of bars (e.g., ib_insync BarDataList), where key is either
+            an .getOCCKey() key ("strike-right-YYYY-MM-DD"), or the symbol, for the underlying's bars.
+        '''
+        me.saveChainArrays(symbol, snapshotDate, me.buildChainArrays(barsByKey))
+
+    def saveChainArrays(me, symbol: str, snapshotDate: str, arrays: dict):
+        np.savez(me.getPath(symbol, snapshotDate), **arrays)
+
+    def appendChain(me, symbol: str, snapshotDate: str, barsByKey: dict):
+        '''
+        Merges new bars into a chain's file (which is created if it doesn't exist yet), e.g., for an incremental refresh.
+        New contracts are added; for existing ones, the new bars are merged in by date, and a new bar with the same date
+        as a stored one replaces it.
+
+        :param barsByKey: same as .saveChain()
+        '''
+        columnsByKey = me.loadChain(symbol, snapshotDate) if me.hasChain(symbol, snapshotDate) else {}
+        for key, bars in barsByKey.items():
+            newColumns = me._barsToColumns(bars)
+            if key not in columnsByKey:
+                columnsByKey[key] = newColumns
+                continue
+            mergedColumns = {name: np.concatenate([columnsByKey[key][name], newColumns[name]]) for name in me.BAR_COLUMNS}
+            # np.unique() of the reversed dates finds the last (i.e., newest) bar for each date, and sorts them by date.
+            reversedIdxs = np.unique(mergedColumns['date'][::-1], return_index=True)[1]
+            keepIdxs = len(mergedColumns['date']) - 1 - reversedIdxs
+            columnsByKey[key] = {name: column[keepIdxs] for name, column in mergedColumns.items()}
+        me.saveChainArrays(symbol, snapshotDate, me.buildChainArraysFromColumns(columnsByKey))
+
+    def getLastBarTimes(me, symbol: str, snapshotDate: str):
+        ''' :return: dict of key -> date (seconds since the epoch) of the contract's most recent stored bar, for contracts with bars. '''
+        contractIndex = me.loadContractIndex(symbol, snapshotDate)
+        dates = me._loadColumn(symbol, snapshotDate, 'date')
+        contractOffsets = contractIndex['contractOffsets']
+        return {key: int(dates[contractOffsets[contractIdx + 1] - 1])
+                for contractIdx, key in enumerate(contractIndex['contractKeys'].tolist())
+                if contractOffsets[contractIdx + 1] > contractOffsets[contractIdx]}
+
+    def buildChainArrays(me, barsByKey: dict):
+        ''' Converts bars (see .saveChain()) into the bar columns and contract index described in the class docstring. '''
+        return me.buildChainArraysFromColumns({key: me._barsToColumns(bars) for key, bars in barsByKey.items()})
+
+    def buildChainArraysFromColumns(me, columnsByKey: dict):
+        ''' Same as .buildChainArrays(), but from dicts of key -> dict of bar column name -> array (as returned by .loadChain()). '''
+        contracts = []
+        for key, contractColumns in columnsByKey.items():
+            right, expiry, strike = me._parseKey(key)
+            contracts.append((right, expiry if expiry is not None else np.datetime64('NaT', 'D'), strike, key, contractColumns))
+        # Underlying ('' right) first, then by right, expiry, and strike.
+        contracts.sort(key=lambda contract: (contract[0], str(contract[1]), contract[2] if not np.isnan(contract[2]) else -1))
+        contractOffsets = np.cumsum([0] + [len(contract[4]['date']) for contract in contracts])
+        arrays = {name: np.concatenate([np.empty(0, dtype=np.int64 if name in ('date', 'volume', 'barCount') else np.float64)]
+                                       + [contract[4][name] for contract in contracts])
+                  for name in me.BAR_COLUMNS}
+        arrays['contractKeys'] = np.asarray([contract[3] for contract in contracts], dtype=str)
+        arrays['contractRights'] = np.asarray([contract[0] for contract in contracts], dtype='U1')
+        arrays['contractExpiries'] = np.asarray([contract[1] for contract in contracts], dtype='datetime64[D]')
+        arrays['contractStrikes'] = np.asarray([contract[2] for contract in contracts], dtype=np.float64)
+        arrays['contractOffsets'] = np.asarray(contractOffsets, dtype=np.int64)
+        return arrays
+
+    def loadChain(me, symbol: str, snapshotDate: str, columns: tuple = BAR_COLUMNS, keys: list = None):
+        '''
+        Loads a whole chain in one read.
+
+        :param columns: which bar columns to load; the others aren't read from disk.
+        :param keys: optional, only return these contracts (still one read per column).
+        :return: dict of key -> dict of column name -> array (views into one array per column, so no copying per contract).
+        '''
+        with np.load(me.getPath(symbol, snapshotDate)) as npz:
+            contractKeys = npz['contractKeys']
+            contractOffsets = npz['contractOffsets']
+            columnArrays = {name: npz[name] for name in columns}
+        return me.splitChainArrays(contractKeys, contractOffsets, columnArrays, keys)
+
+    def splitChainArrays(me, contractKeys, contractOffsets, columnArrays: dict, keys: list = None):
+        ''' Splits whole-chain column arrays into per-contract views, using the contract index. '''
+        wantedKeys = None if keys is None else set(keys)
+        chainBars = {}
+        for contractIdx, key in enumerate(contractKeys.tolist()):
+            if wantedKeys is not None and key not in wantedKeys:
+                continue
+            start, end = contractOffsets[contractIdx], contractOffsets[contractIdx + 1]
+            chainBars[key] = {name: columnArray[start:end] for name, columnArray in columnArrays.items()}
+        return chainBars
+
+    def loadContractIndex(me, symbol: str, snapshotDate: str):
+        ''' Loads just the contract index (see the class docstring), e.g., to select contracts by right/expiry/strike before loading bars. '''
+        with np.load(me.getPath(symbol, snapshotDate)) as npz:
+            return {name: npz[name] for name in me.CONTRACT_COLUMNS}
+
+    def _loadColumn(me, symbol: str, snapshotDate: str, name: str):
+        with np.load(me.getPath(symbol, snapshotDate)) as npz:
+            return npz[name]
+
+    def importPickleDirectory(me, symbol: str, snapshotDate: str, pickleDirPath: str):
+        '''
+        Converts a directory of per-contract "{key}_midpoint.pkl" files (as saved by OptionChain before this store existed)
+        into a single chain file. Unpickling the bars requires ib_insync.
+        '''
+        barsByKey = {}
+        for path in sorted(glob.glob(os.path.join(pickleDirPath, "*_midpoint.pkl"))):
+            key = os.path.basename(path)[:-len("_midpoint.pkl")]
+            barsByKey[key] = loadObject(path)
+        me.saveChain(symbol, snapshotDate, barsByKey)
+
+    def _barsToColumns(me, bars: list):
+        ''' One contract's bars -> dict of bar column name -> array. '''
+        columns = {'date': np.asarray([me._toEpochSeconds(bar.date) for bar in bars], dtype=np.int64)}
+        for name in ('open', 'high', 'low', 'close', 'average'):
+            columns[name] = np.asarray([getattr(bar, name, np.nan) for bar in bars], dtype=np.float64)
+        for name in ('volume', 'barCount'):
+            columns[name] = np.asarray([getattr(bar, name, 0) for bar in bars], dtype=np.int64)
+        return {name: columns[name] for name in me.BAR_COLUMNS}
+
+    def _parseKey(me, key: str):
+        ''' Inverse of utils.getOCCKey(), for keys made with a date expiration; anything else is treated as the underlying. '''
+        parts = key.split('-', 2)
+        if len(parts) == 3 and parts[1] in ('C', 'P'):
+            try:
+                return parts[1], np.datetime64(parts[2], 'D'), float(parts[0])
+            except ValueError:
+                pass
+        return '', None, np.nan
+
+    def _toEpochSeconds(me, barDate):
+        ''' IB bar dates are tz-aware datetimes for intraday bars, and dates for daily bars. '''
+        if isinstance(barDate, datetime):
+            return int(barDate.timestamp()) # Naive datetimes are taken as local time, like datetime.timestamp() does.
+        if isinstance(barDate, date):
+            return int(datetime(barDate.year, barDate.month, barDate.day, tzinfo=timezone.utc).timestamp())
+        return int(barDate)
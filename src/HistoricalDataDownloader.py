@@ -0,0 +1,235 @@
+import asyncio
+import time
+from collections import deque
+
+
+class HistoricalDataDownloader:
+
+    '''
+    Downloads historical bars for many contracts concurrently, while staying under IB's historical data pacing limits.
+
+    IB's limits (see: https://interactivebrokers.github.io/tws-api/historical_limitations.html):
+        - No more than 50 simultaneous open historical data requests
+        - No identical requests within 15 seconds
+        - For bars of 30 seconds or less only:
+            - No more than 60 historical data requests in any 10 minute period
+            - No more than 5 requests for the same contract, exchange, and tick type (whatToShow) within 2 seconds
+
+    These are enforced with:
+        - A semaphore for maxSimultaneousRequests.
+        - A per-request-key timestamp, so an identical request waits out identicalRequestCooldownSeconds.
+        - For requests whose barSizeSetting is smallBarSeconds or less:
+            - A token bucket that holds maxRequestsPerWindow tokens, where each token spent comes back windowSeconds after it was spent.
+              The first maxRequestsPerWindow requests go out immediately, and after that, a request can only go out once the oldest one in the window ages out.
+              (A bucket with a constant refill rate would allow up to twice the limit in one window after a burst, which IB would reject.)
+            - The same kind of bucket per (contract, whatToShow), with maxSameContractRequests tokens per sameContractWindowSeconds.
+          Larger bars only have the first two limits, so e.g. hourly bars for a whole chain aren't held to 60 requests per 10 minutes.
+    A request waits out the pacing limits before it takes a semaphore slot, and only claims them (records its time) once it has one,
+    right before it's sent.
+
+    Requests that raise, or time out (after requestTimeoutSeconds, if given), are retried up to maxRetries times,
+    with exponential backoff starting at backoffSeconds. Retries also go through the pacing checks.
+    An empty result is a valid result by default (e.g., an incremental request for a gap with no new bars), so it's returned as is,
+    without a retry. But ib_insync also returns an empty list when its own timeout (its timeout parameter) runs out, or on most errors,
+    so if empty results can only mean that, set retryEmptyResults, to retry them like failures.
+
+    ib only needs a reqHistoricalDataAsync(**params) coroutine, so a local fake IB object can be used to test this;
+    clock and sleep can also be swapped out so that pacing can be tested without actually waiting.
+    '''
+
+    # Seconds per unit of a barSizeSetting (e.g., "30 secs", "1 min", "4 hours", "1 day").
+    BAR_SIZE_UNIT_SECONDS = {'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400, 'week': 604800, 'month': 2592000}
+
+    def __init__(me, ib, maxRequestsPerWindow: int = 60, windowSeconds: float = 600, maxSimultaneousRequests: int = 50,
+                 identicalRequestCooldownSeconds: float = 15, maxSameContractRequests: int = 5, sameContractWindowSeconds: float = 2,
+                 smallBarSeconds: float = 30, maxRetries: int = 3, backoffSeconds: float = 2, requestTimeoutSeconds: float = None,
+                 retryEmptyResults: bool = False, clock=time.monotonic, sleep=asyncio.sleep):
+        '''
+        :param smallBarSeconds: requests for bars this size or smaller get the windowed limits (maxRequestsPerWindow and maxSameContractRequests);
+            so do requests whose barSizeSetting can't be parsed.
+        :param requestTimeoutSeconds: optional, how long to wait for each request before giving up on it and retrying.
+            To have these fire instead of ib_insync's own timeout, it should be shorter than that (60 seconds by default).
+        :param retryEmptyResults: if True, empty results are retried, and recorded in .failures if they're still empty after maxRetries.
+        '''
+        me.ib = ib
+        me.maxRequestsPerWindow = maxRequestsPerWindow
+        me.windowSeconds = windowSeconds
+        me.maxSameContractRequests = maxSameContractRequests
+        me.sameContractWindowSeconds = sameContractWindowSeconds
+        me.smallBarSeconds = smallBarSeconds
+        me.maxSimultaneousRequests = maxSimultaneousRequests
+        me.identicalRequestCooldownSeconds = identicalRequestCooldownSeconds
+        me.maxRetries = maxRetries
+        me.backoffSeconds = backoffSeconds
+        me.requestTimeoutSeconds = requestTimeoutSeconds
+        me.retryEmptyResults = retryEmptyResults
+        me.clock = clock
+        me.sleep = sleep
+        me.spentTokenTimes = deque() # When each token in the current window was spent, oldest first.
+        me.sameContractTokenTimes = {} # (contract, whatToShow) -> the same, for that contract's bucket.
+        me.lastRequestTimes = {}
+        me.failures = {}
+        me.resetMetrics()
+
+    def resetMetrics(me):
+        me.metrics = {'numRequests': 0, 'numCompleted': 0, 'numEmpty': 0, 'numFailed': 0, 'numRetries': 0, 'numSent': 0,
+                      'inFlight': 0, 'maxInFlight': 0, 'pacingWaitSeconds': 0.0, 'startTime': None, 'endTime': None}
+
+    def getMetrics(me):
+        ''' Returns a copy of the progress metrics, with elapsed time and throughput (completed requests per second) added. '''
+        metrics = dict(me.metrics)
+        if metrics['startTime'] is not None:
+            endTime = metrics['endTime'] if metrics['endTime'] is not None else me.clock()
+            metrics['elapsedSeconds'] = endTime - metrics['startTime']
+            metrics['requestsPerSecond'] = metrics['numCompleted']/metrics['elapsedSeconds'] if metrics['elapsedSeconds'] > 0 else 0.0
+        return metrics
+
+    async def downloadAsync(me, requests: dict, progressCallback=None):
+        '''
+        :param requests: dict of key -> keyword arguments for ib.reqHistoricalDataAsync() (see OptionChain.getHistDataParams()).
+        :param progressCallback: optional, called as progressCallback(key, bars, metrics) each time a request finishes (bars is None if it failed).
+        :return: dict of key -> bars, for the requests that succeeded (including empty results, unless retryEmptyResults is set).
+            Failed keys are in .failures, with the reason.
+        '''
+        me.semaphore = asyncio.Semaphore(me.maxSimultaneousRequests)
+        me.tokenLock = asyncio.Lock()
+        me.metrics['numRequests'] += len(requests)
+        if me.metrics['startTime'] is None:
+            me.metrics['startTime'] = me.clock()
+
+        async def downloadAndReport(key, params):
+            bars = await me._download(key, params)
+            if progressCallback is not None:
+                progressCallback(key, bars, me.getMetrics())
+            return key, bars
+
+        results = await asyncio.gather(*(downloadAndReport(key, params) for key, params in requests.items()))
+        me.metrics['endTime'] = me.clock()
+        return {key: bars for key, bars in results if bars is not None}
+
+    async def _download(me, key, params: dict):
+        requestKey = me._getRequestKey(params)
+        contractKey = (repr(params.get('contract')), params.get('whatToShow'))
+        smallBars = me._isSmallBarSize(params.get('barSizeSetting'))
+        failureReason = None
+        for attempt in range(me.maxRetries + 1):
+            if attempt > 0:
+                me.metrics['numRetries'] += 1
+                await me.sleep(me.backoffSeconds * 2**(attempt - 1))
+            while True:
+                # Pacing waits happen before taking a semaphore slot, so a request that has to wait (e.g., a retry in its cooldown)
+                # doesn't hold up one of the maxSimultaneousRequests slots. Pacing is only claimed once the request has a slot, right
+                # before it's sent; if something else claimed first in the meantime, the slot is let go, and it waits again.
+                await me._waitForPacing(requestKey, contractKey, smallBars)
+                async with me.semaphore:
+                    if not me._claimPacing(requestKey, contractKey, smallBars):
+                        continue
+                    me.metrics['numSent'] += 1
+                    me.metrics['inFlight'] += 1
+                    me.metrics['maxInFlight'] = max(me.metrics['maxInFlight'], me.metrics['inFlight'])
+                    try:
+                        if me.requestTimeoutSeconds is None:
+                            bars = await me.ib.reqHistoricalDataAsync(**params)
+                        else:
+                            bars = await asyncio.wait_for(me.ib.reqHistoricalDataAsync(**params), me.requestTimeoutSeconds)
+                    except Exception as e: # Including asyncio.TimeoutError
+                        bars = None
+                        failureReason = repr(e)
+                    finally:
+                        me.metrics['inFlight'] -= 1
+                break
+            if bars is not None and (len(bars) > 0 or not me.retryEmptyResults):
+                me.metrics['numCompleted'] += 1
+                if len(bars) == 0:
+                    me.metrics['numEmpty'] += 1
+                me.failures.pop(key, None)
+                return bars
+            if bars is not None:
+                failureReason = "No data returned"
+        me.metrics['numFailed'] += 1
+        me.failures[key] = failureReason
+        return None
+
+    async def _waitForPacing(me, requestKey, contractKey, smallBars: bool):
+        '''
+        Waits until the request could go out without breaking any of the pacing limits. Nothing is claimed here; see ._claimPacing().
+        '''
+        while True:
+            # Waits for this request's own limits happen outside the lock, so that e.g. a retry waiting out its cooldown doesn't hold up other requests.
+            waitSeconds = me._getRequestWaitSeconds(requestKey, contractKey, smallBars)
+            if waitSeconds > 0:
+                me.metrics['pacingWaitSeconds'] += waitSeconds
+                await me.sleep(waitSeconds)
+                continue
+            if not smallBars:
+                return
+            async with me.tokenLock: # One waiter at a time, so tokens are handed out in order.
+                while True:
+                    waitSeconds = me._getBucketWaitSeconds(me.spentTokenTimes, me.maxRequestsPerWindow, me.windowSeconds)
+                    if waitSeconds <= 0:
+                        return
+                    me.metrics['pacingWaitSeconds'] += waitSeconds
+                    await me.sleep(waitSeconds)
+
+    def _claimPacing(me, requestKey, contractKey, smallBars: bool):
+        '''
+        If the request can go out now, records it against every pacing limit at once and returns True; otherwise returns False.
+        There's no await in here, so nothing else can claim between the check and the claim, and the caller sends the request right after,
+        so the times recorded are when it was actually sent.
+        Entries that can't hold anything up anymore are dropped as new ones are added, so the dicts don't grow with every distinct request.
+        '''
+        if me._getRequestWaitSeconds(requestKey, contractKey, smallBars) > 0:
+            return False
+        if smallBars and me._getBucketWaitSeconds(me.spentTokenTimes, me.maxRequestsPerWindow, me.windowSeconds) > 0:
+            return False
+        now = me.clock()
+        # Both dicts are kept in the order of their last claim (pop, then re-insert), so the expired entries are always at the front.
+        me.lastRequestTimes.pop(requestKey, None)
+        me.lastRequestTimes[requestKey] = now
+        while len(me.lastRequestTimes) > 1:
+            oldestKey = next(iter(me.lastRequestTimes))
+            if me.lastRequestTimes[oldestKey] + me.identicalRequestCooldownSeconds > now:
+                break
+            del me.lastRequestTimes[oldestKey]
+        if smallBars:
+            me.spentTokenTimes.append(now)
+            tokenTimes = me.sameContractTokenTimes.pop(contractKey, deque())
+            tokenTimes.append(now)
+            me.sameContractTokenTimes[contractKey] = tokenTimes
+            while len(me.sameContractTokenTimes) > 1:
+                oldestKey = next(iter(me.sameContractTokenTimes))
+                if me.sameContractTokenTimes[oldestKey][-1] + me.sameContractWindowSeconds > now:
+                    break
+                del me.sameContractTokenTimes[oldestKey]
+        return True
+
+    def _getRequestWaitSeconds(me, requestKey, contractKey, smallBars: bool):
+        ''' How long until the identical request cooldown, and (for small bars) the same contract bucket, allow this request. '''
+        lastRequestTime = me.lastRequestTimes.get(requestKey, None)
+        waitSeconds = 0 if lastRequestTime is None else lastRequestTime + me.identicalRequestCooldownSeconds - me.clock()
+        if smallBars and contractKey in me.sameContractTokenTimes:
+            tokenTimes = me.sameContractTokenTimes[contractKey]
+            waitSeconds = max(waitSeconds, me._getBucketWaitSeconds(tokenTimes, me.maxSameContractRequests, me.sameContractWindowSeconds))
+        return waitSeconds
+
+    def _getBucketWaitSeconds(me, spentTokenTimes: deque, maxTokens: int, windowSeconds: float):
+        ''' Refills the bucket (tokens come back windowSeconds after they were spent), and returns how long until it has a token. '''
+        now = me.clock()
+        while len(spentTokenTimes) > 0 and spentTokenTimes[0] + windowSeconds <= now:
+            spentTokenTimes.popleft()
+        if len(spentTokenTimes) < maxTokens:
+            return 0
+        return spentTokenTimes[0] + windowSeconds - now
+
+    def _isSmallBarSize(me, barSizeSetting):
+        ''' True if barSizeSetting (e.g., "30 secs", "1 hour") is smallBarSeconds or less, or can't be parsed. '''
+        try:
+            count, unit = str(barSizeSetting).split()
+            barSeconds = int(count)*next(seconds for prefix, seconds in me.BAR_SIZE_UNIT_SECONDS.items() if unit.startswith(prefix))
+        except (ValueError, StopIteration):
+            return True
+        return barSeconds <= me.smallBarSeconds
+
+    def _getRequestKey(me, params: dict):
+        ''' Requests are identical if every parameter (including the contract's fields) matches. '''
+        return tuple((name, repr(value)) for name, value in sorted(params.items()))
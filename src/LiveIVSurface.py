@@ -0,0 +1,173 @@
+import math
+import time
+from datetime import date
+
+import numpy as np
+
+from src.BSMRootFinder import BSMRootFinder
+from src.utils import getOCCKey
+
+
+class LiveIVSurface:
+
+    '''
+    Streaming version of OptionChain.calculateIVs(): keeps the strike x expiry IV matrix up to date from live quotes,
+    rather than recomputing it from historical bars.
+
+    Every contract in the chain's grid (and the underlying) gets a reqMktData() subscription, and ib_insync's pendingTickersEvent
+    delivers the tickers that changed. An option tick only re-solves that contract's cell. An underlying tick changes every cell,
+    so it just marks the whole surface stale, and the surface is re-solved in one vectorized call the next time it's published.
+
+    The surface is published (passed to onPublish) at most once every publishIntervalSeconds, on the first tick after the interval is up,
+    no matter how many ticks come in; quotes in between still update the matrix.
+
+    Prices are quote midpoints (the historical bars are MIDPOINT bars too); cells without a two sided quote, or whose IV didn't converge
+    (see BSMRootFinder.getBSIVResults()), are NaN.
+
+    Cells are warm started (see BSMRootFinder.getBSIVArray()'s priorIVs) from their last IV, or, if they don't have one yet,
+    from the nearest strike's IV in the same expiry; between ticks, an IV barely moves, so most cells converge in one or two steps.
+
+    ib only needs reqMktData(), cancelMktData(), and a pendingTickersEvent, so a local fake IB object can be used to test this;
+    clock can also be swapped out so that publishing can be tested without waiting.
+    '''
+
+    def __init__(me, ib, optionChain, right: str, r: float, publishIntervalSeconds: float = 1.0, onPublish=None,
+                 solverMethod: str = 'newton', clock=time.monotonic):
+        '''
+        :param optionChain: an OptionChain that .createOptionContracts() has been run on (for its qualified contracts, strikes, and expiries).
+        :param right: 'P' or 'C' for put or call.
+        :param r: risk free rate, as a decimal, not percent.
+        :param onPublish: called with the dict from .getSurface() each time the surface is published.
+        :param solverMethod: see BSMRootFinder.getBSIVArray(); Newton's method needs a few iterations per cell, where bisection needs 17+.
+        '''
+        me.ib = ib
+        me.optionChain = optionChain
+        me.right = right
+        me.r = r
+        me.publishIntervalSeconds = publishIntervalSeconds
+        me.onPublish = onPublish
+        me.solverMethod = solverMethod
+        me.clock = clock
+        me.brf = BSMRootFinder()
+        me.strikes = np.asarray(optionChain.strikes, dtype=np.float64)
+        me.expiriesDates = list(optionChain.expiriesDates)
+        me.ivMatrix = np.full((len(me.strikes), len(me.expiriesDates)), np.nan)
+        me.priceMatrix = np.full(me.ivMatrix.shape, np.nan)
+        me.underlyingPrice = np.nan
+        me.surfaceStale = False # True when the underlying has moved since the cells were last solved.
+        me.lastPublishTime = None
+        me.numTicks = 0
+        me.numCellUpdates = 0
+        me.numPublishes = 0
+        me.numSolverIterations = 0 # Total over every solve, to keep an eye on how much the warm starts are saving.
+        me.tickers = {} # conId -> Ticker
+        me.cellIdxs = {} # conId -> (strikeIdx, expiryIdx)
+        me.underlyingContract = optionChain.underlyingContract
+        me.updateYearsToExpiry()
+
+    def updateYearsToExpiry(me, today: date = None):
+        ''' Calendar days to expiry / 365, as in OptionChain.calculateIVs(); called on start, but should be called again if the stream runs past midnight. '''
+        today = date.today() if today is None else today
+        me.daysToExpiry = np.asarray([(expiry - today).days for expiry in me.expiriesDates], dtype=np.float64)
+        me.yearsToExpiry = me.daysToExpiry/365.0
+
+    def start(me):
+        ''' Subscribes to quotes for the underlying and every qualified contract in the grid. '''
+        for expiryIdx, expiryDate in enumerate(me.expiriesDates):
+            for strikeIdx, strike in enumerate(me.strikes.tolist()):
+                contract = me.optionChain.ocContracts.get(getOCCKey(strike, me.right, expiryDate), None)
+                if contract is not None:
+                    me.cellIdxs[contract.conId] = (strikeIdx, expiryIdx)
+                    me.tickers[contract.conId] = me.ib.reqMktData(contract)
+        me.tickers[me.underlyingContract.conId] = me.ib.reqMktData(me.underlyingContract)
+        me.ib.pendingTickersEvent += me.onPendingTickers
+        print(f"Subscribed to quotes for {len(me.cellIdxs)} of {me.ivMatrix.size} contracts, and the underlying.")
+
+    def stop(me):
+        me.ib.pendingTickersEvent -= me.onPendingTickers
+        for ticker in me.tickers.values():
+            me.ib.cancelMktData(ticker.contract)
+        me.tickers = {}
+        me.cellIdxs = {}
+
+    def onPendingTickers(me, tickers):
+        ''' pendingTickersEvent handler: updates the cells for the tickers that changed, then publishes, if it's time to. '''
+        for ticker in tickers:
+            me.numTicks += 1
+            price = me._getTickerPrice(ticker)
+            conId = ticker.contract.conId
+            if conId == me.underlyingContract.conId:
+                if not math.isnan(price) and price != me.underlyingPrice:
+                    me.underlyingPrice = price
+                    me.surfaceStale = True
+            elif conId in me.cellIdxs:
+                strikeIdx, expiryIdx = me.cellIdxs[conId]
+                if price != me.priceMatrix[strikeIdx, expiryIdx]:
+                    me.priceMatrix[strikeIdx, expiryIdx] = price
+                    if not me.surfaceStale:
+                        me.updateCell(strikeIdx, expiryIdx)
+        now = me.clock()
+        if me.lastPublishTime is None or now - me.lastPublishTime >= me.publishIntervalSeconds:
+            me.publish()
+
+    def updateCell(me, strikeIdx: int, expiryIdx: int):
+        ''' Re-solves one cell's IV from its last quote and the last underlying price. '''
+        price = me.priceMatrix[strikeIdx, expiryIdx]
+        me.numCellUpdates += 1
+        if math.isnan(price) or math.isnan(me.underlyingPrice):
+            me.ivMatrix[strikeIdx, expiryIdx] = np.nan
+            return
+        priorIV = me.getPriorIVs(np.asarray([strikeIdx]), np.asarray([expiryIdx]))[0]
+        me.ivMatrix[strikeIdx, expiryIdx] = me._solveIVs(price, me.yearsToExpiry[expiryIdx], me.strikes[strikeIdx], priorIV)
+
+    def updateSurface(me):
+        ''' Re-solves every cell with a quote, in one vectorized call (e.g., after the underlying moves). '''
+        if math.isnan(me.underlyingPrice):
+            return
+        strikeIdxs, expiryIdxs = np.nonzero(~np.isnan(me.priceMatrix))
+        priorIVs = me.getPriorIVs(strikeIdxs, expiryIdxs)
+        me.ivMatrix[:] = np.nan
+        if len(strikeIdxs) > 0:
+            me.ivMatrix[strikeIdxs, expiryIdxs] = me._solveIVs(me.priceMatrix[strikeIdxs, expiryIdxs], me.yearsToExpiry[expiryIdxs],
+                                                               me.strikes[strikeIdxs], priorIVs)
+        me.numCellUpdates += len(strikeIdxs)
+        me.surfaceStale = False
+
+    def _solveIVs(me, prices, yearsToExpiry, strikes, priorIVs):
+        ''' :return: the IVs for the given cells, NaN where the search didn't converge (so the last guess isn't published, or used as a prior). '''
+        ivResults = me.brf.getBSIVResults(prices, me.right == 'C', yearsToExpiry, me.underlyingPrice, strikes, me.r, method=me.solverMethod,
+                                          priorIVs=priorIVs)
+        me.numSolverIterations += int(ivResults['iterations'].sum())
+        return np.where(ivResults['converged'], ivResults['iv'], np.nan)
+
+    def getPriorIVs(me, strikeIdxs, expiryIdxs):
+        ''' Each cell's current IV, or where it doesn't have one, the IV of the nearest strike in the same expiry that does (NaN if none do). '''
+        priorIVs = me.ivMatrix[strikeIdxs, expiryIdxs].copy()
+        for i in np.nonzero(np.isnan(priorIVs))[0]:
+            solvedStrikeIdxs = np.nonzero(~np.isnan(me.ivMatrix[:, expiryIdxs[i]]))[0]
+            if len(solvedStrikeIdxs) > 0:
+                priorIVs[i] = me.ivMatrix[solvedStrikeIdxs[np.argmin(np.abs(solvedStrikeIdxs - strikeIdxs[i]))], expiryIdxs[i]]
+        return priorIVs
+
+    def publish(me):
+        if me.surfaceStale:
+            me.updateSurface()
+        me.lastPublishTime = me.clock()
+        me.numPublishes += 1
+        if me.onPublish is not None:
+            me.onPublish(me.getSurface())
+
+    def getSurface(me):
+        '''
+        :return: dict with 'ivMatrix' (a copy; rows are strikes, columns are expiries, NaN where there's no quote),
+            'strikes', 'daysToExpiry', 'underlyingPrice', and 'publishTime' (from clock).
+        '''
+        return {'ivMatrix': me.ivMatrix.copy(), 'strikes': me.strikes, 'daysToExpiry': me.daysToExpiry,
+                'underlyingPrice': me.underlyingPrice, 'publishTime': me.lastPublishTime}
+
+    def _getTickerPrice(me, ticker):
+        ''' Quote midpoint, or NaN without a two sided quote (ib_insync uses NaN, and IB sends -1, for missing bids/asks). '''
+        bid, ask = ticker.bid, ticker.ask
+        if bid is None or ask is None or math.isnan(bid) or math.isnan(ask) or bid < 0 or ask <= 0:
+            return np.nan
+        return (bid + ask)/2.0
@@ -3,6 +3,7 @@ from datetime import time, datetime, timedelta
 from typing import Union
 
 import dateutil
+import numpy as np
 import pandas_market_calendars as pmc
 from dateutil.parser import parse
 from dateutil.tz import tz
@@ -83,8 +84,11 @@ class MarketCalendar:
 
 
     def createSchedule(me, scheduleStartDatetimeTz: datetime, scheduleEndDatetimeTz: datetime):
-        ''' these start and end datetimes should generally run past the desired data start and end datetimes in both directions. '''
-        me.exchangeSchedule = me.exchangeCalendar.schedule(start_date=scheduleStartDatetimeTz, end_date=scheduleEndDatetimeTz)
+        '''
+        these start and end datetimes should generally run past the desired data start and end datetimes in both directions.
+        The schedule is sliced out of pandas_market_calendars' schedule cache, which only builds dates it hasn't seen yet for this calendar.
+        '''
+        me.exchangeSchedule = me.exchangeCalendar.schedule(start_date=scheduleStartDatetimeTz, end_date=scheduleEndDatetimeTz, use_cache=True)
         print(f"Schedule for date range: {scheduleStartDatetimeTz} - {scheduleEndDatetimeTz}\n{me.exchangeSchedule}")
 
     def getMostRecentPreviousDateOpenFrom(me, referenceDatetimeTz: datetime):
@@ -132,6 +136,15 @@ class MarketCalendar:
         isOpen = me.exchangeCalendar.open_at_time(me.exchangeSchedule, referenceDatetimeTz)
         return isOpen
 
+    def isMarketOpenArray(me, datetimesTz, includeClose: bool = False):
+        '''
+        Vectorized isMarketOpen(), e.g., to filter tick timestamps to trading hours: mask = isMarketOpenArray(ticks.index); ticks[mask]
+        The schedule must cover every date in datetimesTz (see createSchedule()).
+        :param datetimesTz: DatetimeIndex (naive is taken to be UTC), or int64 nanoseconds since the epoch (UTC).
+        :return: numpy bool array, True where the market is open.
+        '''
+        return me.exchangeCalendar.open_at_times(me.exchangeSchedule, datetimesTz, include_close=includeClose)
+
 
     def adjustDataStart(me, proposedDataStart: datetime):
         '''
@@ -174,29 +187,22 @@ class MarketCalendar:
         # Adjust the start datetime to ensure the market is open, and we backtrack the requested number of bars.
         adjustedDataStartTz = me.adjustDataStart(proposedDataStart=dataStartTz)
 
-        openCloseTupleDeque = deque()
-        finishedAddingTuples = False
+        # Every bar boundary of every day in the schedule, in one pass: consecutive boundaries of the same day are a bar's (open, close).
+        # The last one of each day is its market close, even if the day doesn't end on an intervalStr boundary (e.g., a 6.5 hour session with "1D");
+        # otherwise, sessions shorter than intervalStr would be left out entirely.
         intervalStr, intervalTimedelta = me.getPandasDateRangeFreqForQuerySize(barSizeTimedelta)
-        # Note: This section will leave the deque empty in situations where a datetime range is selected that is less than 'intervalStr'. E.g., a two hour period, but intervalStr is "1D".
-        for curTuple in me.exchangeSchedule.itertuples():
-            #dr = pd.date_range(curTuple[1], curTuple[2], freq=intervalStr, tz=timezone, closed=None)
-            dr = pd.date_range(curTuple[1], curTuple[2], freq=intervalStr, closed=None)
-            for i in range(len(dr)-1):
-                openDatetimeTz = dr[i].to_pydatetime()
-                #print(f"open: {openDatetimeTz}")
-                if (openDatetimeTz + intervalTimedelta) <= adjustedDataStartTz:
-                    continue
-                closeDatetimeTz = dr[i + 1].to_pydatetime()
-                openCloseTuple = (openDatetimeTz.astimezone(timezone), closeDatetimeTz.astimezone(timezone))
-                #print(openCloseTuple)
-                openCloseTupleDeque.append(openCloseTuple)
-                if closeDatetimeTz > adjustedDataEndTz or closeDatetimeTz > datetime.now(tz=timezone): # Second part of if statement was temp fix.
-                    finishedAddingTuples = True
-                    break
-            if finishedAddingTuples:
-                break
-                #print(openCloseTuple)
-
+        boundaries, sessions = pmc.session_boundaries_int64(me.exchangeSchedule, intervalStr, force_close=True)
+        sameSession = sessions[:-1] == sessions[1:]
+        barOpens, barCloses = boundaries[:-1][sameSession], boundaries[1:][sameSession]
+        # Skip bars that end before the adjusted start, and stop after the first bar that closes past the end (or now; this was a temp fix).
+        afterStart = barOpens + pd.Timedelta(intervalTimedelta).value > pd.Timestamp(adjustedDataStartTz).value
+        barOpens, barCloses = barOpens[afterStart], barCloses[afterStart]
+        endNs = min(pd.Timestamp(adjustedDataEndTz).value, pd.Timestamp(datetime.now(tz=timezone)).value)
+        pastEnd = np.nonzero(barCloses > endNs)[0]
+        if len(pastEnd) > 0:
+            barOpens, barCloses = barOpens[:pastEnd[0] + 1], barCloses[:pastEnd[0] + 1]
+        openCloseTupleDeque = deque(zip(pd.DatetimeIndex(barOpens, tz='UTC').tz_convert(timezone).to_pydatetime(),
+                                        pd.DatetimeIndex(barCloses, tz='UTC').tz_convert(timezone).to_pydatetime()))
 
         # Note: This (below) will likely have a problem if the adjustedDataStartTz is not at least a full barSizeSetting time period before/earlier than the close of the tuple (index 1).
         #    - Fix this. It may be fixed by rounding the dataStartTz down as recommended in the note above.
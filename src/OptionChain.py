@@ -1,10 +1,18 @@
+import asyncio
 import os
-from datetime import datetime
+from concurrent.futures import Executor
+from datetime import datetime, timedelta
 import numpy as np
+from dateutil.tz import tz
 
 from ib_insync import IB, Contract, Option, BarDataList
 
 from src.BSMRootFinder import BSMRootFinder
+from src.ChainBarCache import ChainBarCache
+from src.ChainBarStore import ChainBarStore
+from src.HistoricalDataDownloader import HistoricalDataDownloader
+from src.MarketCalendar import MarketCalendar
+from src.OptionDatabase import OptionDatabase
 from src.utils import expiryStrToDate, getOCCKey, saveObject, loadObject
 
 
@@ -16,8 +24,10 @@ class OptionChain:
     Code to request and initially process option chain from IB from: https://nbviewer.org/github/erdewit/ib_insync/blob/master/notebooks/option_chain.ipynb
     '''
 
-    def __init__(me, ib: IB, underlyingContract: Contract):
+    def __init__(me, ib: IB, underlyingContract: Contract, database: OptionDatabase = None):
+        ''' :param database: optional; if given, requested chains, contracts, and bars are also written to it. '''
         me.ib = ib
+        me.database = database
         me.optionChainBasePath = "./resources/data/oc/"
         me.optionChainPricesBasePath = "./resources/data/oc_prices_2021_12_10_hourly_bars_1_day/"
         me.underlyingContract = underlyingContract
@@ -25,50 +35,136 @@ class OptionChain:
         me.exchange = "CBOE"
         me.ocContracts = {}
         me.ocContractsBarDataLists = {}
+        me.ocContractsCloses = {} # ocKey -> np.array of bar closes; this is what the IV calculations use.
+        me.underlyingCloses = None
+        me.barStore = ChainBarStore(me.optionChainPricesBasePath)
+        me.barCache = ChainBarCache(me.optionChainPricesBasePath)
+        me.snapshotDate = "2021-12-10" # The date the bars in optionChainPricesBasePath were downloaded; set to today when new data is requested.
+        me.qualificationFailures = {}
+        me.histDataDownloader = HistoricalDataDownloader(ib)
+        me.barSizeSetting = '1 hour'
+        me.barSizeTimedelta = timedelta(hours=1) # Must match barSizeSetting.
+        me.marketCalendar = MarketCalendar() # Only used for incremental refreshes; the calendar itself is created the first time it's needed.
         me.daysToExpiryList = []
         me.expiriesDates = []
 
-    def calculateIVs(me, right: str, r: float):
+    def calculateIVs(me, right: str, r: float, numWorkers: int = 1, chunkSize: int = 1024, executor: Executor = None, priorIVMatrix: np.ndarray = None,
+                     forwardBased: bool = False):
         '''
         This function uses the BSMRootFinder to calculate the implied volatilities of the options contracts,
         using the BlackScholesMerton class to price them.
 
         IVs are put into the ivMatrix 2D numpy array, where the rows are the strikes,
-        and columns are expiries.
+        and columns are expiries. Cells without a converged IV (no data, a quote outside the no-arbitrage bounds, or a search
+        that hit maxIters) are NaN; .ivResults has the details for every cell (see .calculateIVsForChains()).
 
         :param right: 'P' or 'C' for put or call.
         :param r: risk free rate, as a decimal, not percent.
+        :param numWorkers: if > 1 (or an executor is passed in), the strike x expiry grid is split into chunks of chunkSize contracts,
+            which are solved across a process pool (see BSMRootFinder.getBSIVArrayParallel()).
+        :param chunkSize: number of contracts per task sent to a worker process
+        :param executor: optional, an already running process pool to use
+        :param priorIVMatrix: optional, e.g., the ivMatrix from the last time the surface was calculated (same strikes and expiries);
+            each contract's IV search is warm started from its cell (see BSMRootFinder.getBSIVArray()'s priorIVs). Cells <= 0 or NaN start cold.
+        :param forwardBased: if True, the underlying's price is taken as the forward, and contracts are priced with Black-76
+            (see BSMRootFinder.getBlack76IVResults()), discounted at e^(-rt); e.g., for options on futures, like ES.
         :return: ivMatrix
         '''
+        return OptionChain.calculateIVsForChains([me], right, r, numWorkers=numWorkers, chunkSize=chunkSize, executor=executor,
+                                                 priorIVMatrices=None if priorIVMatrix is None else [priorIVMatrix], forwardBased=forwardBased)[0]
+
+    @staticmethod
+    def calculateIVsForChains(optionChains: list, right: str, r: float, numWorkers: int = 1, chunkSize: int = 1024, executor: Executor = None,
+                              priorIVMatrices: list = None, forwardBased: bool = False, priorBracketWidth: float = 0.05, skipInvalidQuotes: bool = True):
+        '''
+        Same as .calculateIVs(), but for several underlyings at once:
+        every chain's contracts are solved together (so they can all be spread across the same process pool),
+        and then split back out into one ivMatrix per chain, in the same order as optionChains.
+
+        Each chain also gets an .ivResults dict, with one strike x expiry matrix per BSMRootFinder.getBSIVResults() array:
+        'iv' (unrounded, including the last guess of searches that didn't converge), 'converged', 'iterations', 'priceError', and 'status'
+        (a BSMRootFinder.IV_STATUS_NAMES code; cells without data are QUOTE_INVALID).
+
+        :param priorIVMatrices: optional, one prior ivMatrix (or None) per chain; see .calculateIVs()
+        :param forwardBased: see .calculateIVs(); applies to every chain.
+        :param priorBracketWidth: see BSMRootFinder.getBSIVArray(); the serial and parallel solvers get the same solver arguments.
+        :param skipInvalidQuotes: see BSMRootFinder.getBSIVArray()
+        '''
+        ivInputs = [oc._gatherIVInputs(right) for oc in optionChains]
+        currentPrices = np.concatenate([inputs['currentPrices'] for inputs in ivInputs])
+        yearsToExpiry = np.concatenate([inputs['yearsToExpiry'] for inputs in ivInputs])
+        underlyingPrices = np.concatenate([inputs['underlyingPrices'] for inputs in ivInputs])
+        strikes = np.concatenate([inputs['strikes'] for inputs in ivInputs])
+        priorIVs = None
+        if priorIVMatrices is not None:
+            priorIVs = np.concatenate([np.full(len(inputs['currentPrices']), np.nan) if priorIVMatrix is None
+                                       else np.asarray(priorIVMatrix, dtype=np.float64)[inputs['strikeIdxs'], inputs['expiryIdxs']]
+                                       for inputs, priorIVMatrix in zip(ivInputs, priorIVMatrices)])
+        brf = BSMRootFinder()
+        solverArgs = {'priorIVs': priorIVs, 'priorBracketWidth': priorBracketWidth, 'skipInvalidQuotes': skipInvalidQuotes}
+        if forwardBased:
+            discountFactors = np.exp(-r*yearsToExpiry)
+            if numWorkers > 1 or executor is not None:
+                ivResults = brf.getBlack76IVResultsParallel(currentPrices, right == 'C', yearsToExpiry, underlyingPrices, strikes, discountFactors,
+                                                            numWorkers=numWorkers, chunkSize=chunkSize, executor=executor, **solverArgs)
+            else:
+                ivResults = brf.getBlack76IVResults(currentPrices, right == 'C', yearsToExpiry, underlyingPrices, strikes, discountFactors, **solverArgs)
+        elif numWorkers > 1 or executor is not None:
+            ivResults = brf.getBSIVResultsParallel(currentPrices, right == 'C', yearsToExpiry, underlyingPrices, strikes, r,
+                                                   numWorkers=numWorkers, chunkSize=chunkSize, executor=executor, **solverArgs)
+        else:
+            ivResults = brf.getBSIVResults(currentPrices, right == 'C', yearsToExpiry, underlyingPrices, strikes, r, **solverArgs)
+        ivMatrices = []
+        offset = 0
+        for oc, inputs in zip(optionChains, ivInputs):
+            numContracts = len(inputs['currentPrices'])
+            contractIdxs = (inputs['strikeIdxs'], inputs['expiryIdxs'])
+            oc.ivResults = {'iv': np.full(inputs['shape'], np.nan), 'converged': np.zeros(inputs['shape'], dtype=bool),
+                            'iterations': np.zeros(inputs['shape'], dtype=np.int32), 'priceError': np.full(inputs['shape'], np.nan),
+                            'status': np.full(inputs['shape'], brf.QUOTE_INVALID, dtype=np.int8)}
+            for name, resultMatrix in oc.ivResults.items():
+                resultMatrix[contractIdxs] = ivResults[name][offset:offset + numContracts]
+            offset += numContracts
+            ivMatrix = np.where(oc.ivResults['converged'], np.round(oc.ivResults['iv'], 5), np.nan)
+            statuses, statusCounts = np.unique(oc.ivResults['status'][contractIdxs], return_counts=True)
+            statusCounts = {brf.IV_STATUS_NAMES[status]: count for status, count in zip(statuses.tolist(), statusCounts.tolist())}
+            print(f"Finished {numContracts} of {ivMatrix.size} calculations ({int(oc.ivResults['iterations'].sum())} solver iterations): {statusCounts}")
+            ivMatrices.append(ivMatrix)
+        return ivMatrices
+
+    def _gatherIVInputs(me, right: str):
+        '''
+        Collects the price of every contract in the strike x expiry grid that has data, so all of the IVs can be solved in one vectorized call.
+        :return: dict of arrays (one element per contract found), plus the grid's shape.
+        '''
         numExpiries = len(me.expiriesDates)
         numStrikes = len(me.strikes)
         print(f"Starting on {numExpiries} x {numStrikes} = {numExpiries*numStrikes} IV calculations...")
-        ivMatrix = np.zeros((numStrikes, numExpiries))
-        underlyingPrice = np.mean([bar.close for bar in me.underlyingBarDataList])
-        brf = BSMRootFinder()
-        numCalcuations = 0
-        totalCalculations = numExpiries * numStrikes
+        underlyingPrice = np.mean(me.underlyingCloses)
+        strikeIdxs = []
+        expiryIdxs = []
+        currentPrices = []
         for expiryIdx in range(numExpiries):
             expiryDate = me.expiriesDates[expiryIdx]
             for strikeIdx in range(numStrikes):
                 strike = me.strikes[strikeIdx]
-                daysToExpiry = me.daysToExpiryList[expiryIdx]
                 ocContractKey = getOCCKey(strike, right, expiryDate)
-                ocContract = me.ocContracts.get(ocContractKey, None)
-                barDataList = me.ocContractsBarDataLists.get(ocContractKey, None)
-                if barDataList is None or len(barDataList) == 0:
+                closes = me.ocContractsCloses.get(ocContractKey, None)
+                if closes is None or len(closes) == 0:
                     print(f"Error retrieving option contract: {strike} {right} {expiryDate}")
                 else:
-                    try:
-                        mrbCloseAvg = np.mean([bar.close for bar in barDataList])# Call this the current price of the option
-                    except IndexError as ie:
-                        continue
-                    yearsToExpiry = daysToExpiry/365.0
-                    calculatedIV = brf.getBSIV(mrbCloseAvg, right, yearsToExpiry, underlyingPrice, strike, r)
-                    ivMatrix[strikeIdx, expiryIdx] = calculatedIV
-                    numCalcuations += 1
-                    print(f"\rFinished {numCalcuations} of {totalCalculations} calculations (IV: {calculatedIV})")
-        return ivMatrix
+                    mrbCloseAvg = np.mean(closes) # Call this the current price of the option
+                    strikeIdxs.append(strikeIdx)
+                    expiryIdxs.append(expiryIdx)
+                    currentPrices.append(mrbCloseAvg)
+        ivInputs = {'shape': (numStrikes, numExpiries)}
+        ivInputs['strikeIdxs'] = np.asarray(strikeIdxs, dtype=int)
+        ivInputs['expiryIdxs'] = np.asarray(expiryIdxs, dtype=int)
+        ivInputs['currentPrices'] = np.asarray(currentPrices, dtype=np.float64)
+        ivInputs['yearsToExpiry'] = np.asarray(me.daysToExpiryList, dtype=np.float64)[ivInputs['expiryIdxs']]/365.0
+        ivInputs['strikes'] = np.asarray(me.strikes, dtype=np.float64)[ivInputs['strikeIdxs']]
+        ivInputs['underlyingPrices'] = np.full(len(currentPrices), underlyingPrice)
+        return ivInputs
 
     def reqOptionChains(me, saveChains: bool = True):
         ''' Requests and saves option chains for the underlying contract, or loads previously saved ones. '''
@@ -77,6 +173,8 @@ class OptionChain:
         me.ticker = me.ib.reqTickers(me.underlyingContract)
         # this returns all of the option chains, across all exchanges
         optionChains = me.ib.reqSecDefOptParams(me.underlyingContract.symbol, '', me.underlyingContract.secType, me.underlyingContract.conId)
+        if me.database is not None:
+            me.database.saveOptionChains(me.underlyingContract.symbol, int(datetime.now().timestamp()), optionChains)
 
         underlyingIdx = 0
         for oc in optionChains:
@@ -93,7 +191,8 @@ class OptionChain:
         oc = loadObject(os.path.join(me.optionChainBasePath, f"{me.underlyingContract.symbol}_{me.exchange}.pkl"))
         me.chain = oc
 
-    def createOptionContracts(me, reqNewData: bool):
+    def createOptionContracts(me, reqNewData: bool, useBarStore: bool = True, useBarCache: bool = True, incremental: bool = False,
+                              asyncQualify: bool = True, qualifyBatchSize: int = 50, maxConcurrentQualifyBatches: int = 8):
         '''
         This creates option contracts from the option chain.
         Contracts are put into the .ocContracts dictionary, keyed by the key generated by .getOCCKey(strike, right, expiration)
@@ -102,18 +201,66 @@ class OptionChain:
         and then loads data for them.
         It also does this with/for the underlying.
 
+        Contracts that couldn't be qualified are put into the .qualificationFailures dictionary (same keys), with the reason.
+
         Ideally, this function wouldn't do quite as much as it does; it's fine for now though.
+        :param useBarStore: if True, bars are saved to (and loaded from, if it exists) one ChainBarStore file for the whole chain,
+            rather than one pickle per contract. If there's no store file for .snapshotDate yet, but the chain's pickles are in
+            .optionChainPricesBasePath (as saved with useBarStore=False), they're imported into one first (see ChainBarStore.importPickleDirectory()),
+            so the first store-backed run doesn't download them all again.
+        :param useBarCache: if True (and useBarStore is True), the chain's bars are memory-mapped from the ChainBarCache instead,
+            which is built from the store the first time it's needed (and whenever new data is saved).
+        :param incremental: if True (and reqNewData and useBarStore are True), rather than re-downloading every contract's bars,
+            only the bars since each contract's last stored bar are requested (see .getIncrementalHistDataParams()), and they're
+            appended to the store file for .snapshotDate. Contracts with nothing new since their last bar aren't requested at all.
+            If there's no store file for .snapshotDate yet (and no pickles to import), everything is downloaded, as usual.
+        :param asyncQualify: if True, contracts are qualified with .qualifyOptionContractsAsync(), in concurrent batches,
+            instead of one round trip to TWS/Gateway per contract.
+        :param qualifyBatchSize: number of contracts per qualifyContractsAsync() call
+        :param maxConcurrentQualifyBatches: max number of batches in flight at once
         :return:
         '''
+        symbol = me.underlyingContract.symbol
+        storedChainBars = None
+        storedLastBarTimes = None # key -> last stored bar date, when refreshing incrementally.
+        gapDurationStrs = {}
+        hasStoredChain = me.barStore.hasChain(symbol, me.snapshotDate) or (useBarCache and me.barCache.hasChain(symbol, me.snapshotDate))
+        if useBarStore and (not reqNewData or incremental) and not hasStoredChain and os.path.exists(os.path.join(me.optionChainPricesBasePath, f"{symbol}_midpoint.pkl")):
+            # Chains saved as pickles (before there was a store) are imported once, rather than downloaded again.
+            me.barStore.importPickleDirectory(symbol, me.snapshotDate, me.optionChainPricesBasePath)
         if reqNewData:
             now = datetime.now()
-            histData: BarDataList = me.getHistData(contract=me.underlyingContract, endDt=now)
+            if incremental and useBarStore and me.barStore.hasChain(symbol, me.snapshotDate):
+                storedLastBarTimes = me.barStore.getLastBarTimes(symbol, me.snapshotDate)
+                histDataParams = me.getIncrementalHistDataParams(me.underlyingContract, storedLastBarTimes.get(symbol), now, gapDurationStrs)
+                histData = me.ib.reqHistoricalData(**histDataParams) if histDataParams is not None else BarDataList()
+            else:
+                me.snapshotDate = now.date().isoformat()
+                histData: BarDataList = me.getHistData(contract=me.underlyingContract, endDt=now)
             me.underlyingBarDataList = histData
             # print(histData)
-            saveObject(histData, os.path.join(me.optionChainPricesBasePath, f"{me.underlyingContract.symbol}_midpoint.pkl"))
+            if storedLastBarTimes is not None and len(histData) == 0:
+                # Nothing new for the underlying; its stored closes are needed to pick strikes.
+                storedChainBars = me.barStore.loadChain(symbol, me.snapshotDate, columns=('close',), keys=[symbol])
+            if not useBarStore:
+                saveObject(histData, os.path.join(me.optionChainPricesBasePath, f"{symbol}_midpoint.pkl"))
+        elif useBarStore and useBarCache and (me.barCache.hasChain(symbol, me.snapshotDate) or me.barStore.hasChain(symbol, me.snapshotDate)):
+            if not me.barCache.hasChain(symbol, me.snapshotDate):
+                me.barCache.buildFromStore(me.barStore, symbol, me.snapshotDate)
+            # Nothing is read up front; the closes are paged in as they're used.
+            storedChainBars = me.barCache.loadChain(symbol, me.snapshotDate, columns=('close',))
+            me.underlyingBarDataList = None
+        elif useBarStore and me.barStore.hasChain(symbol, me.snapshotDate):
+            # The whole chain comes in with one read; only the closes are needed.
+            storedChainBars = me.barStore.loadChain(symbol, me.snapshotDate, columns=('close',))
+            me.underlyingBarDataList = None
         else:
-            me.underlyingBarDataList = loadObject(os.path.join(me.optionChainPricesBasePath, f"{me.underlyingContract.symbol}_midpoint.pkl"))
-        underlyingValue = me.underlyingBarDataList[-1].close
+            me.underlyingBarDataList = loadObject(os.path.join(me.optionChainPricesBasePath, f"{symbol}_midpoint.pkl"))
+        if storedChainBars is not None:
+            me.underlyingCloses = storedChainBars[symbol]['close']
+        else:
+            me.underlyingCloses = me._getCloses(me.underlyingBarDataList)
+        underlyingValue = me.underlyingCloses[-1]
 
         # Get strikes by fives within 12% of the underlying (IB was missing a contract or two for 15%)
         strikeMin = underlyingValue * .87
@@ -131,40 +278,117 @@ class OptionChain:
                      for expiry in me.expiriesStrs
                      for strike in me.strikes]
 
-        #contracts = ib.qualifyContracts(*contracts)
         me.ocContractsBarDataLists = {}
-        numIndexErrors = 0
+        me.ocContractsCloses = {}
+        me.qualificationFailures = {}
+        if asyncQualify:
+            qualifiedContracts = me.ib.run(me.qualifyOptionContractsAsync(optionContracts, batchSize=qualifyBatchSize,
+                                                                            maxConcurrentBatches=maxConcurrentQualifyBatches))
+        else:
+            qualifiedContracts = []
+            for optionContract in optionContracts:
+                try:
+                    qualifiedContracts.append(me.ib.qualifyContracts(optionContract)[0]) # Qualifying 1 contract at a time, but a list is returned; extract the first (and only) element.
+                except IndexError as ie: # Couldn't qualify the contract, so just move on.
+                    me.qualificationFailures[me._getContractOCCKey(optionContract)] = "Unknown or ambiguous contract"
+
         contractNumber = 0
-        numContracts = len(optionContracts)
-        for optionContract in optionContracts:
+        numContracts = len(qualifiedContracts)
+        histDataRequests = {}
+        now = datetime.now()
+        for optionContract in qualifiedContracts:
             contractNumber += 1
-            try:
-                optionContract = me.ib.qualifyContracts(optionContract)[0] # Qualifying 1 contract at a time for now, but a list is returned; extract the first (and only) element.
-            except IndexError as ie: # Couldn't qualify the contract, so just move on.
-                # Note: These errors just mean the broker doesn't have a contract for the specific strike, date, and right combination. Ignore them.
-                numIndexErrors += 1
-                continue
-            strike = optionContract.strike
-            right = optionContract.right
-            expiry = expiryStrToDate(optionContract.lastTradeDateOrContractMonth)
-            ocKey = getOCCKey(strike, right, expiry)
-            print(f"Getting data for contract {contractNumber} of {numContracts} (key: {ocKey})")
+            ocKey = me._getContractOCCKey(optionContract)
             me.ocContracts[ocKey] = optionContract
             #print(optionContract)
-            # Either get new data and save it, or load the historic data we need.
-            if reqNewData:
-                now = datetime.now()
-                histData: BarDataList = me.getHistData(contract=optionContract, endDt=now)
-                me.ocContractsBarDataLists[ocKey] = histData
-                #print(histData)
-                saveObject(histData, os.path.join(me.optionChainPricesBasePath, f"{ocKey}_midpoint.pkl"))
+            # Either queue up a request for new data (they're all downloaded concurrently below), or load the historic data we need.
+            if reqNewData and storedLastBarTimes is not None:
+                histDataParams = me.getIncrementalHistDataParams(optionContract, storedLastBarTimes.get(ocKey), now, gapDurationStrs)
+                if histDataParams is not None:
+                    histDataRequests[ocKey] = histDataParams
+            elif reqNewData:
+                histDataRequests[ocKey] = me.getHistDataParams(contract=optionContract, endDt=now)
+            elif storedChainBars is not None:
+                if ocKey in storedChainBars:
+                    me.ocContractsCloses[ocKey] = storedChainBars[ocKey]['close']
             else:
+                print(f"Loading data for contract {contractNumber} of {numContracts} (key: {ocKey})")
                 me.ocContractsBarDataLists[ocKey] = loadObject(os.path.join(me.optionChainPricesBasePath, f"{ocKey}_midpoint.pkl"))
+                me.ocContractsCloses[ocKey] = me._getCloses(me.ocContractsBarDataLists[ocKey])
             #if len(me.ocContracts) > 100:
             #    break
+        if len(histDataRequests) > 0:
+            def printProgress(ocKey, histData, metrics):
+                print(f"Finished {metrics['numCompleted'] + metrics['numFailed']} of {metrics['numRequests']} data requests "
+                      f"(key: {ocKey}, {metrics['requestsPerSecond']:.2f} requests/s, {metrics['numRetries']} retries)")
+            downloadedHistData = me.ib.run(me.histDataDownloader.downloadAsync(histDataRequests, progressCallback=printProgress))
+            for ocKey, histData in downloadedHistData.items():
+                me.ocContractsBarDataLists[ocKey] = histData
+                me.ocContractsCloses[ocKey] = me._getCloses(histData)
+                if not useBarStore:
+                    saveObject(histData, os.path.join(me.optionChainPricesBasePath, f"{ocKey}_midpoint.pkl"))
+            print(f"Could not get data for {len(me.histDataDownloader.failures)} contracts: {me.histDataDownloader.failures}")
+            print(f"No new bars for {me.histDataDownloader.getMetrics()['numEmpty']} contracts.")
+        if reqNewData and storedLastBarTimes is not None:
+            print(f"Requested new bars for {len(histDataRequests)} of {len(qualifiedContracts)} contracts.")
+            me.barStore.appendChain(symbol, me.snapshotDate, {symbol: me.underlyingBarDataList, **me.ocContractsBarDataLists})
+            # The closes have to come from the store now, since the new bars are only the ones since the last refresh.
+            storedChainBars = me.barStore.loadChain(symbol, me.snapshotDate, columns=('close',))
+            me.underlyingCloses = storedChainBars[symbol]['close']
+            for optionContract in qualifiedContracts:
+                ocKey = me._getContractOCCKey(optionContract)
+                if ocKey in storedChainBars:
+                    me.ocContractsCloses[ocKey] = storedChainBars[ocKey]['close']
+            if useBarCache:
+                me.barCache.buildFromStore(me.barStore, symbol, me.snapshotDate)
+        elif reqNewData and useBarStore:
+            me.barStore.saveChain(symbol, me.snapshotDate, {symbol: me.underlyingBarDataList, **me.ocContractsBarDataLists})
+            if useBarCache:
+                me.barCache.buildFromStore(me.barStore, symbol, me.snapshotDate)
+        if reqNewData and me.database is not None:
+            barsByContract = [(me.underlyingContract, me.underlyingBarDataList)]
+            barsByContract += [(me.ocContracts[ocKey], histData) for ocKey, histData in me.ocContractsBarDataLists.items()]
+            me.database.saveBars(int(now.timestamp()), barsByContract)
+
+        # Note: These failures usually just mean the broker doesn't have a contract for the specific strike, date, and right combination.
+        print(f"Could not qualify {len(me.qualificationFailures)} of {len(optionContracts)} contracts.")
+
+    async def qualifyOptionContractsAsync(me, optionContracts: list, batchSize: int = 50, maxConcurrentBatches: int = 8):
+        '''
+        Qualifies contracts with ib_insync's async API, batchSize contracts per request, with at most maxConcurrentBatches requests in flight.
+
+        qualifyContractsAsync() qualifies contracts in place, and only returns the ones it could qualify,
+        so anything in a batch that isn't returned is recorded in .qualificationFailures (keyed by .getOCCKey()).
+        If a whole batch raises, every contract in it is recorded with the exception.
+
+        :return: list of qualified contracts, in the same order as optionContracts.
+        '''
+        semaphore = asyncio.Semaphore(maxConcurrentBatches)
+        batches = [optionContracts[start:start + batchSize] for start in range(0, len(optionContracts), batchSize)]
+
+        async def qualifyBatch(batch: list):
+            async with semaphore:
+                try:
+                    qualified = await me.ib.qualifyContractsAsync(*batch)
+                except Exception as e:
+                    for contract in batch:
+                        me.qualificationFailures[me._getContractOCCKey(contract)] = repr(e)
+                    return []
+            qualifiedIds = {id(contract) for contract in qualified}
+            for contract in batch:
+                if id(contract) not in qualifiedIds:
+                    me.qualificationFailures[me._getContractOCCKey(contract)] = "Unknown or ambiguous contract"
+            return qualified
+
+        batchResults = await asyncio.gather(*(qualifyBatch(batch) for batch in batches))
+        return [contract for qualified in batchResults for contract in qualified]
 
-        # Note: These errors just mean the broker doesn't have a contract for the specific strike, date, and right combination. Ignore them.
-        print(f"Encountered {numIndexErrors} errors when attempting to qualify {len(optionContracts)} contracts.")
+    def _getCloses(me, barDataList: BarDataList):
+        return np.asarray([bar.close for bar in barDataList], dtype=np.float64)
+
+    def _getContractOCCKey(me, optionContract: Contract):
+        expiry = expiryStrToDate(optionContract.lastTradeDateOrContractMonth)
+        return getOCCKey(optionContract.strike, optionContract.right, expiry)
 
     def getDaysToExpiry(me):
         '''
@@ -193,5 +417,56 @@ class OptionChain:
 
     def getHistData(me, contract: Contract, endDt: datetime):
         ''' Just a wrapper to make sure any parameter changes are reflected across all requests. '''
-        histData: BarDataList = me.ib.reqHistoricalData(contract=contract, endDateTime=endDt, durationStr="1 D", barSizeSetting='1 hour', whatToShow="MIDPOINT", useRTH=True)
+        histData: BarDataList = me.ib.reqHistoricalData(**me.getHistDataParams(contract, endDt))
         return histData
+
+    def getHistDataParams(me, contract: Contract, endDt: datetime):
+        ''' The parameters for every historical data request, both synchronous (.getHistData()) and through the HistoricalDataDownloader. '''
+        return dict(contract=contract, endDateTime=endDt, durationStr="1 D", barSizeSetting=me.barSizeSetting, whatToShow="MIDPOINT", useRTH=True)
+
+    def getIncrementalHistDataParams(me, contract: Contract, lastBarTime: int, endDt: datetime, gapDurationStrs: dict = None):
+        '''
+        Parameters to request only the bars since a contract's last stored bar, or None if the market hasn't been open long enough
+        since then for another bar to have finished (so nights, weekends, and holidays don't cost a request).
+
+        The request starts at the last stored bar (not after it), so that if that bar was still in progress when it was downloaded,
+        it gets replaced by the finished one (see ChainBarStore.appendChain()).
+        The duration only covers the sessions in the gap, using .marketCalendar's open/close times.
+
+        :param lastBarTime: date of the contract's last stored bar, in seconds since the epoch; if None, the usual full request is returned.
+        :param gapDurationStrs: optional dict of lastBarTime -> durationStr (or None), filled in as gaps are computed;
+            most contracts share a last bar time, so passing the same dict for every contract computes each gap once.
+        '''
+        if lastBarTime is None:
+            return me.getHistDataParams(contract, endDt)
+        if gapDurationStrs is None:
+            gapDurationStrs = {}
+        if lastBarTime not in gapDurationStrs:
+            gapDurationStrs[lastBarTime] = me._getGapDurationStr(lastBarTime, endDt)
+        if gapDurationStrs[lastBarTime] is None:
+            return None
+        histDataParams = me.getHistDataParams(contract, endDt)
+        histDataParams['durationStr'] = gapDurationStrs[lastBarTime]
+        return histDataParams
+
+    def _getGapDurationStr(me, lastBarTime: int, endDt: datetime):
+        ''' The IB durationStr covering the market sessions from lastBarTime to endDt, or None if no bar could have finished in between. '''
+        if not me.marketCalendar.calendarInitialized:
+            me.marketCalendar.createCalendarByName(me.exchange)
+        utc = tz.tzutc()
+        lastBarStartTz = datetime.fromtimestamp(lastBarTime, tz=utc)
+        endDtTz = endDt.astimezone(utc) # Naive datetimes are taken as local time.
+        if endDtTz <= lastBarStartTz + me.barSizeTimedelta:
+            return None
+        openCloseTuples = me.marketCalendar.getOpenCloseTupleDeque(dataStartTz=lastBarStartTz, dataEndTz=endDtTz, setLastCloseToNone=False,
+                                                                   barSizeTimedelta=me.barSizeTimedelta, timezone=utc)
+        # Market time after the last stored bar would have ended; if there isn't any, there's nothing new.
+        lastBarEndTz = lastBarStartTz + me.barSizeTimedelta
+        openAfterLastBar = sum(((closeTz - max(openTz, lastBarEndTz)) for openTz, closeTz in openCloseTuples if closeTz > lastBarEndTz), timedelta())
+        if openAfterLastBar <= timedelta():
+            return None
+        numSessions = len({openTz.date() for openTz, closeTz in openCloseTuples})
+        gapSeconds = int((endDtTz - lastBarStartTz).total_seconds()) + 1
+        if numSessions == 1 and gapSeconds <= 86400: # IB's "S" durations are limited to 86400 seconds.
+            return f"{gapSeconds} S"
+        return f"{numSessions} D"
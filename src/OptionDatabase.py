@@ -0,0 +1,247 @@
+import sqlite3
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+
+class OptionDatabase:
+
+    '''
+    SQLite storage for option chains (reqSecDefOptParams results), qualified contracts, and bars.
+    Runs locally from a single file (or ":memory:"), no server needed.
+
+    Tables:
+        - option_chains: one row per chain (symbol, snapshot, exchange), with chain_expirations and chain_strikes holding its lists.
+        - contracts: one row per qualified contract, keyed by conId.
+        - bars: one row per bar. symbol, right, expiry, and strike are copied in from the contract (denormalized),
+            so that the common queries ("these calls, these expiries, the last N snapshots") only need the
+            (symbol, snapshot_ts, expiry, strike) index, and no join.
+
+    Timestamps (snapshot_ts, bar_ts) are stored as integer seconds since the epoch, and expiries as 'YYYY-MM-DD' text,
+    so both sort and compare correctly in SQL.
+
+    Everything is written with executemany() inside one transaction per call.
+    '''
+
+    SCHEMA = \
+        '''
+        CREATE TABLE IF NOT EXISTS option_chains (
+            chain_id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            snapshot_ts INTEGER NOT NULL,
+            exchange TEXT NOT NULL,
+            underlying_con_id INTEGER,
+            trading_class TEXT,
+            multiplier TEXT,
+            UNIQUE (symbol, snapshot_ts, exchange)
+        );
+        CREATE TABLE IF NOT EXISTS chain_expirations (
+            chain_id INTEGER NOT NULL REFERENCES option_chains(chain_id),
+            expiry TEXT NOT NULL,
+            PRIMARY KEY (chain_id, expiry)
+        );
+        CREATE TABLE IF NOT EXISTS chain_strikes (
+            chain_id INTEGER NOT NULL REFERENCES option_chains(chain_id),
+            strike REAL NOT NULL,
+            PRIMARY KEY (chain_id, strike)
+        );
+        CREATE TABLE IF NOT EXISTS contracts (
+            con_id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            sec_type TEXT,
+            right TEXT,
+            expiry TEXT,
+            strike REAL,
+            exchange TEXT,
+            local_symbol TEXT
+        );
+        CREATE INDEX IF NOT EXISTS contracts_symbol_expiry_strike ON contracts (symbol, expiry, strike);
+        CREATE TABLE IF NOT EXISTS bars (
+            con_id INTEGER NOT NULL,
+            snapshot_ts INTEGER NOT NULL,
+            bar_ts INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            right TEXT,
+            expiry TEXT,
+            strike REAL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            volume INTEGER,
+            average REAL,
+            bar_count INTEGER,
+            PRIMARY KEY (con_id, snapshot_ts, bar_ts)
+        );
+        CREATE INDEX IF NOT EXISTS bars_symbol_snapshot_expiry_strike ON bars (symbol, snapshot_ts, expiry, strike);
+        '''
+
+    BAR_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'average', 'bar_count')
+
+    def __init__(me, dbPath: str):
+        ''' :param dbPath: path to the SQLite file (created if it doesn't exist), or ":memory:" '''
+        me.connection = sqlite3.connect(dbPath)
+        me.connection.executescript(me.SCHEMA)
+
+    def close(me):
+        me.connection.close()
+
+    def saveOptionChains(me, symbol: str, snapshotTs: int, optionChains: list):
+        '''
+        :param optionChains: reqSecDefOptParams() results (anything with exchange, underlyingConId, tradingClass, multiplier, expirations, strikes).
+        :param snapshotTs: when the chains were requested, seconds since the epoch.
+        '''
+        with me.connection:
+            for oc in optionChains:
+                # Upsert (not INSERT OR REPLACE) so a re-saved chain keeps its chain_id, then replace its lists outright,
+                # otherwise the old chain_id's expirations/strikes would be orphaned (or stale ones kept).
+                me.connection.execute(
+                    "INSERT INTO option_chains (symbol, snapshot_ts, exchange, underlying_con_id, trading_class, multiplier) VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (symbol, snapshot_ts, exchange) DO UPDATE SET "
+                    "underlying_con_id = excluded.underlying_con_id, trading_class = excluded.trading_class, multiplier = excluded.multiplier",
+                    (symbol, snapshotTs, oc.exchange, oc.underlyingConId, oc.tradingClass, oc.multiplier))
+                chainId = me.connection.execute("SELECT chain_id FROM option_chains WHERE symbol = ? AND snapshot_ts = ? AND exchange = ?",
+                                                (symbol, snapshotTs, oc.exchange)).fetchone()[0]
+                me.connection.execute("DELETE FROM chain_expirations WHERE chain_id = ?", (chainId,))
+                me.connection.execute("DELETE FROM chain_strikes WHERE chain_id = ?", (chainId,))
+                me.connection.executemany("INSERT OR REPLACE INTO chain_expirations (chain_id, expiry) VALUES (?, ?)",
+                                          [(chainId, me._toExpiryText(expiry)) for expiry in oc.expirations])
+                me.connection.executemany("INSERT OR REPLACE INTO chain_strikes (chain_id, strike) VALUES (?, ?)",
+                                          [(chainId, float(strike)) for strike in oc.strikes])
+
+    def loadOptionChain(me, symbol: str, exchange: str, snapshotTs: int = None):
+        '''
+        Loads the chain for symbol/exchange as of snapshotTs (the most recent one if None).
+        :return: a SimpleNamespace with the same fields as a reqSecDefOptParams() result (expirations as "YYYYMMDD" strings, like IB), or None.
+        '''
+        query = "SELECT chain_id, snapshot_ts, underlying_con_id, trading_class, multiplier FROM option_chains WHERE symbol = ? AND exchange = ?"
+        params = [symbol, exchange]
+        if snapshotTs is not None:
+            query += " AND snapshot_ts = ?"
+            params.append(snapshotTs)
+        row = me.connection.execute(query + " ORDER BY snapshot_ts DESC LIMIT 1", params).fetchone()
+        if row is None:
+            return None
+        chainId, snapshotTs, underlyingConId, tradingClass, multiplier = row
+        expirations = [expiry.replace('-', '') for (expiry,) in
+                       me.connection.execute("SELECT expiry FROM chain_expirations WHERE chain_id = ? ORDER BY expiry", (chainId,))]
+        strikes = [strike for (strike,) in me.connection.execute("SELECT strike FROM chain_strikes WHERE chain_id = ? ORDER BY strike", (chainId,))]
+        return SimpleNamespace(exchange=exchange, underlyingConId=underlyingConId, tradingClass=tradingClass, multiplier=multiplier,
+                               expirations=expirations, strikes=strikes, snapshotTs=snapshotTs)
+
+    def saveContracts(me, contracts: list):
+        ''' :param contracts: qualified contracts (they need a conId). '''
+        with me.connection:
+            me.connection.executemany(
+                "INSERT OR REPLACE INTO contracts (con_id, symbol, sec_type, right, expiry, strike, exchange, local_symbol) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [me._getContractRow(contract) for contract in contracts])
+
+    def saveBars(me, snapshotTs: int, barsByContract: list):
+        '''
+        :param barsByContract: list of (contract, bars) pairs; the contracts should be qualified, and are saved too.
+        '''
+        barRows = []
+        for contract, bars in barsByContract:
+            conId, symbol, secType, right, expiry, strike, exchange, localSymbol = me._getContractRow(contract)
+            for bar in bars:
+                barRows.append((conId, snapshotTs, me._toEpochSeconds(bar.date), symbol, right, expiry, strike,
+                                bar.open, bar.high, bar.low, bar.close, getattr(bar, 'volume', None), getattr(bar, 'average', None),
+                                getattr(bar, 'barCount', None)))
+        with me.connection:
+            me.connection.executemany(
+                "INSERT OR REPLACE INTO contracts (con_id, symbol, sec_type, right, expiry, strike, exchange, local_symbol) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [me._getContractRow(contract) for contract, bars in barsByContract])
+            me.connection.executemany(
+                f"INSERT OR REPLACE INTO bars (con_id, snapshot_ts, bar_ts, symbol, right, expiry, strike, {', '.join(me.BAR_COLUMNS)}) "
+                f"VALUES ({', '.join(['?']*(7 + len(me.BAR_COLUMNS)))})", barRows)
+
+    def getSnapshotTimestamps(me, symbol: str, lastN: int = None):
+        ''' :return: int64 array of the snapshot timestamps with bars for symbol, most recent first. '''
+        query = "SELECT DISTINCT snapshot_ts FROM bars WHERE symbol = ? ORDER BY snapshot_ts DESC"
+        params = [symbol]
+        if lastN is not None:
+            query += " LIMIT ?"
+            params.append(lastN)
+        return np.array([snapshotTs for (snapshotTs,) in me.connection.execute(query, params)], dtype=np.int64)
+
+    def queryBars(me, symbol: str, right: str = None, expiryStart=None, expiryEnd=None, strikeMin: float = None, strikeMax: float = None,
+                  lastNSnapshots: int = None, columns: tuple = ('close',)):
+        '''
+        E.g., all AAPL calls expiring in the next 30 days, for the last 20 snapshots:
+            queryBars('AAPL', right='C', expiryStart=today, expiryEnd=today + timedelta(days=30), lastNSnapshots=20)
+
+        :param expiryStart: inclusive, date or "YYYYMMDD"/"YYYY-MM-DD" string
+        :param expiryEnd: inclusive, same as expiryStart
+        :param columns: bar columns to return, from .BAR_COLUMNS
+        :return: dict of NumPy arrays, one element per bar, sorted by (snapshot, expiry, strike, right, bar time):
+            'conId', 'snapshotTs', 'barTs' (int64 seconds since the epoch), 'right', 'expiry' (datetime64[D]), 'strike', plus each of columns.
+        '''
+        for column in columns:
+            if column not in me.BAR_COLUMNS:
+                raise ValueError(f"Unknown bar column: '{column}'")
+        conditions = ["symbol = ?"]
+        params = [symbol]
+        if lastNSnapshots is not None:
+            snapshots = me.getSnapshotTimestamps(symbol, lastN=lastNSnapshots)
+            if len(snapshots) == 0:
+                return me._toArrays([], columns)
+            conditions.append("snapshot_ts >= ?")
+            params.append(int(snapshots[-1]))
+        if right is not None:
+            conditions.append("right = ?")
+            params.append(right)
+        if expiryStart is not None:
+            conditions.append("expiry >= ?")
+            params.append(me._toExpiryText(expiryStart))
+        if expiryEnd is not None:
+            conditions.append("expiry <= ?")
+            params.append(me._toExpiryText(expiryEnd))
+        if strikeMin is not None:
+            conditions.append("strike >= ?")
+            params.append(strikeMin)
+        if strikeMax is not None:
+            conditions.append("strike <= ?")
+            params.append(strikeMax)
+        query = (f"SELECT con_id, snapshot_ts, bar_ts, right, expiry, strike{''.join(', ' + column for column in columns)} FROM bars "
+                 f"WHERE {' AND '.join(conditions)} ORDER BY snapshot_ts, expiry, strike, right, bar_ts")
+        return me._toArrays(me.connection.execute(query, params).fetchall(), columns)
+
+    def _toArrays(me, rows: list, columns: tuple):
+        names = ('conId', 'snapshotTs', 'barTs', 'right', 'expiry', 'strike') + tuple(columns)
+        columnValues = list(zip(*rows)) if len(rows) > 0 else [()]*len(names)
+        arrays = {}
+        for name, values in zip(names, columnValues):
+            if name in ('conId', 'snapshotTs', 'barTs'):
+                arrays[name] = np.array(values, dtype=np.int64)
+            elif name in ('volume', 'bar_count'):
+                arrays[name] = np.array([value if value is not None else 0 for value in values], dtype=np.int64)
+            elif name == 'right':
+                arrays[name] = np.array(values, dtype='U1')
+            elif name == 'expiry':
+                arrays[name] = np.array([value if value is not None else 'NaT' for value in values], dtype='datetime64[D]')
+            else:
+                arrays[name] = np.array([value if value is not None else np.nan for value in values], dtype=np.float64)
+        return arrays
+
+    def _getContractRow(me, contract):
+        expiry = me._toExpiryText(contract.lastTradeDateOrContractMonth) if getattr(contract, 'lastTradeDateOrContractMonth', '') else None
+        strike = contract.strike if getattr(contract, 'strike', 0) else None
+        right = contract.right if getattr(contract, 'right', '') else None
+        return (contract.conId, contract.symbol, getattr(contract, 'secType', None), right, expiry, strike,
+                getattr(contract, 'exchange', None), getattr(contract, 'localSymbol', None))
+
+    def _toExpiryText(me, expiry):
+        ''' Accepts a date/datetime, or an IB-style "YYYYMMDD" (or "YYYY-MM-DD") string, and returns "YYYY-MM-DD". '''
+        if isinstance(expiry, (date, datetime)):
+            return expiry.strftime("%Y-%m-%d")
+        expiry = str(expiry).split()[0].replace('-', '')
+        return f"{expiry[:4]}-{expiry[4:6]}-{expiry[6:8]}"
+
+    def _toEpochSeconds(me, timestamp):
+        ''' Same conversion as ChainBarStore: tz-aware datetimes (intraday bars) as-is, dates (daily bars) as UTC midnight. '''
+        if isinstance(timestamp, datetime):
+            return int(timestamp.timestamp())
+        if isinstance(timestamp, date):
+            return int(datetime(timestamp.year, timestamp.month, timestamp.day, tzinfo=timezone.utc).timestamp())
+        return int(timestamp)
@@ -0,0 +1,264 @@
+import time
+
+import numpy as np
+
+from src.BSMGreeks import BSMGreeks
+from src.BSMRootFinder import BSMRootFinder
+from src.BlackScholesMerton import BlackScholesMerton
+
+
+class SolverBenchmark:
+
+    '''
+    Speed and accuracy benchmarks for the pricing, IV, and Greeks engines, run on a synthetic corpus of contracts,
+    so that a change to any of them can be shown to be faster without quietly losing accuracy.
+
+    The corpus is a full grid of both rights over:
+        - moneyness (K/S) from deep ITM to deep OTM, where vega is close to 0 and Newton steps are meaningless
+        - days to expiry from 1 (almost no time value) to 2 years
+        - true IVs from 5% to 200% (above 100%, a cold bisection search can't reach them; see BSMRootFinder.getBSIVArray())
+    plus EDGE_CASES, short dated quotes near the money that a solver has gotten wrong before.
+    Each contract's reference price is priced from its true IV with the 'scipy.stats' kernel, so the corpus doesn't depend
+    on the kernel being tested. It is generated from a fixed seed, and can be saved with .saveCorpus(), so later runs can be checked
+    against exactly the same contracts.
+
+    Speed is measured per batch (one call to the engine with batchSize contracts):
+        - 'contractsPerSecond': total contracts / total time
+        - 'p50Ms', 'p99Ms': batch latency percentiles, in milliseconds
+
+    Accuracy is a round trip: reference price -> IV -> price, for every IV method, cold and warm started;
+    a mode passes if its IVs are close to the true IVs, and every contract it should have solved converged (see .checkRoundTrip()).
+
+    Black-76 modes quote the same contracts on their forwards, F = Se^(rt), and discount factors, e^(-rt), so their results should match.
+    '''
+
+    NORM_KERNELS = ('ndtr', 'scipy.stats')
+    IV_METHODS = ('bisection', 'newton', 'halley', 'rational')
+    MONEYNESS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.98, 1.0, 1.02, 1.05, 1.1, 1.2, 1.3, 1.5, 2.0)
+    DAYS_TO_EXPIRY = (1, 2, 7, 14, 30, 60, 90, 180, 365, 730)
+    SIGMAS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.8, 1.2, 2.0)
+    # (K/S, years to expiry, r, true IV), both rights: short dated quotes near the money (s^2 << |ln(F/K)|),
+    # where the 'rational' method's Householder steps used to overshoot to a negative IV, or NaN.
+    EDGE_CASES = ((0.9908, 0.00357, 0.0366, 0.0713), (0.99685, 0.021, 0.0366, 0.0228))
+
+    def __init__(me, S: float = 100.0, r: float = 0.02, seed: int = 0, priorIVNoise: float = 0.02):
+        '''
+        :param seed: seeds the small amount of randomness in the corpus (the warm start priors, and the latency sample order).
+        :param priorIVNoise: warm start priors are the true IV times a uniform random factor in [1 - priorIVNoise, 1 + priorIVNoise],
+            like an IV that has moved a little since it was last solved.
+        '''
+        me.S = S
+        me.r = r
+        me.seed = seed
+        me.priorIVNoise = priorIVNoise
+        me.corpus = None
+
+    def generateCorpus(me):
+        ''' :return: dict of flat arrays, one element per contract: 'isCall', 'sigma', 'yte', 'S', 'K', 'r', 'price', and 'priorIV'. '''
+        isCall, moneyness, daysToExpiry, sigma = (x.ravel() for x in np.meshgrid([True, False], me.MONEYNESS, me.DAYS_TO_EXPIRY, me.SIGMAS, indexing='ij'))
+        edgeMoneyness, edgeYte, edgeR, edgeSigma = (np.tile(x, 2) for x in np.asarray(me.EDGE_CASES, dtype=np.float64).T)
+        isCall = np.concatenate([isCall, np.repeat([True, False], len(me.EDGE_CASES))])
+        rng = np.random.default_rng(me.seed)
+        corpus = {'isCall': isCall, 'sigma': np.concatenate([sigma, edgeSigma]), 'yte': np.concatenate([daysToExpiry/365.0, edgeYte])}
+        corpus['S'] = np.full(len(isCall), me.S)
+        corpus['K'] = me.S*np.concatenate([moneyness, edgeMoneyness])
+        corpus['r'] = np.concatenate([np.full(len(moneyness), me.r), edgeR])
+        corpus['price'] = BlackScholesMerton(normKernel='scipy.stats').priceOptions(isCall, corpus['sigma'], corpus['yte'], corpus['S'], corpus['K'], corpus['r'])
+        corpus['priorIV'] = corpus['sigma']*rng.uniform(1 - me.priorIVNoise, 1 + me.priorIVNoise, len(isCall))
+        me.corpus = corpus
+        return corpus
+
+    def saveCorpus(me, path: str):
+        np.savez(path, **me.getCorpus())
+
+    def loadCorpus(me, path: str):
+        with np.load(path) as npz:
+            me.corpus = {name: npz[name] for name in npz.files}
+        return me.corpus
+
+    def getCorpus(me):
+        return me.generateCorpus() if me.corpus is None else me.corpus
+
+    def timeBatches(me, engineFn, numContracts: int, batchSize: int, maxBatches: int = 1000):
+        '''
+        Times engineFn(idxs) over the corpus, in batches of batchSize contracts.
+
+        :param engineFn: called with an index array into the corpus, one batch at a time.
+        :param maxBatches: for small batch sizes, only a random sample of this many batches is timed.
+        :return: dict with 'batchSize', 'numContracts' (timed), 'contractsPerSecond', 'p50Ms', and 'p99Ms'.
+        '''
+        contractIdxs = np.random.default_rng(me.seed).permutation(numContracts)
+        batches = [contractIdxs[start:start + batchSize] for start in range(0, numContracts, batchSize)][:maxBatches]
+        engineFn(batches[0]) # Warm up (lazy imports, first-call allocations).
+        batchSeconds = np.empty(len(batches))
+        for batchIdx, batchIdxs in enumerate(batches):
+            startTime = time.perf_counter()
+            engineFn(batchIdxs)
+            batchSeconds[batchIdx] = time.perf_counter() - startTime
+        numTimed = sum(len(batchIdxs) for batchIdxs in batches)
+        return {'batchSize': batchSize, 'numContracts': numTimed, 'contractsPerSecond': numTimed/batchSeconds.sum(),
+                'p50Ms': np.percentile(batchSeconds, 50)*1e3, 'p99Ms': np.percentile(batchSeconds, 99)*1e3}
+
+    def getForwards(me):
+        ''' :return: the corpus' forwards and discount factors, for the Black-76 modes. '''
+        corpus = me.getCorpus()
+        discountFactors = np.exp(-corpus['r']*corpus['yte'])
+        return corpus['S']/discountFactors, discountFactors
+
+    def benchmarkPricing(me, normKernel: str, batchSize: int, fromTerms: bool = False, forwardBased: bool = False):
+        '''
+        :param fromTerms: if True, times BlackScholesMerton.priceOptionsFromTerms() with the contract terms computed ahead of time
+            (as the IV solvers do), rather than .priceOptions().
+        :param forwardBased: if True (and not fromTerms), times BlackScholesMerton.priceBlack76Options().
+        '''
+        corpus = me.getCorpus()
+        bs = BlackScholesMerton(normKernel=normKernel)
+        isCall, sigma, yte, S, K, r = (corpus[name] for name in ('isCall', 'sigma', 'yte', 'S', 'K', 'r'))
+        F, discountFactor = me.getForwards()
+        if forwardBased and not fromTerms:
+            engineFn = lambda idxs: bs.priceBlack76Options(isCall[idxs], sigma[idxs], yte[idxs], F[idxs], K[idxs], discountFactor[idxs])
+        elif fromTerms:
+            terms = bs.computeContractTerms(yte, S, K, r)
+            engineFn = lambda idxs: bs.priceOptionsFromTerms(isCall[idxs], sigma[idxs], bs.selectContractTerms(terms, idxs))
+        else:
+            engineFn = lambda idxs: bs.priceOptions(isCall[idxs], sigma[idxs], yte[idxs], S[idxs], K[idxs], r[idxs])
+        return me.timeBatches(engineFn, len(isCall), batchSize)
+
+    def benchmarkIV(me, normKernel: str, method: str, batchSize: int, warmStart: bool = False, forwardBased: bool = False):
+        ''' :param forwardBased: if True, times BSMRootFinder.getBlack76IVArray(), rather than .getBSIVArray(). '''
+        corpus = me.getCorpus()
+        brf = BSMRootFinder(normKernel=normKernel)
+        price, isCall, yte, S, K, r, priorIV = (corpus[name] for name in ('price', 'isCall', 'yte', 'S', 'K', 'r', 'priorIV'))
+        F, discountFactor = me.getForwards()
+        if forwardBased:
+            engineFn = lambda idxs: brf.getBlack76IVArray(price[idxs], isCall[idxs], yte[idxs], F[idxs], K[idxs], discountFactor[idxs], method=method,
+                                                          priorIVs=priorIV[idxs] if warmStart else None)
+        else:
+            engineFn = lambda idxs: brf.getBSIVArray(price[idxs], isCall[idxs], yte[idxs], S[idxs], K[idxs], r[idxs], method=method,
+                                                     priorIVs=priorIV[idxs] if warmStart else None)
+        return me.timeBatches(engineFn, len(price), batchSize)
+
+    def benchmarkGreeks(me, normKernel: str, batchSize: int):
+        corpus = me.getCorpus()
+        bsmGreeks = BSMGreeks(normKernel=normKernel)
+        isCall, sigma, yte, S, K, r = (corpus[name] for name in ('isCall', 'sigma', 'yte', 'S', 'K', 'r'))
+        engineFn = lambda idxs: bsmGreeks.computeGreeks(isCall[idxs], sigma[idxs], yte[idxs], S[idxs], K[idxs], r[idxs])
+        return me.timeBatches(engineFn, len(isCall), batchSize)
+
+    def checkRoundTrip(me, normKernel: str, method: str, warmStart: bool = False, testEpsilon: float = 1e-4, minVega: float = 1e-2,
+                       forwardBased: bool = False, initialIVGuess: float = 1, maxIVError: float = None, maxFailures: int = 0):
+        '''
+        Solves the IV of every contract from its reference price, reprices it at that IV, and compares both with the corpus.
+        If forwardBased, both the solve and the repricing are Black-76.
+
+        :param minVega: the IV error is only meaningful where the price is sensitive to IV, so it's only measured as is where vega >= minVega;
+            below that, it's scaled by vega/minVega (i.e., it's measured in price, as a price error of testEpsilon would be).
+        :param maxIVError: the most (scaled) IV error allowed to pass; None is 2*testEpsilon/minVega: the IV error a price error of testEpsilon
+            can cause at minVega, with room for vega changing between the true and the solved IV.
+        :param maxFailures: the most failures (see 'failed', below) allowed to pass.
+        :return: dict with:
+            - 'maxPriceError': max |repriced - reference price| over converged contracts (should be <= testEpsilon)
+            - 'maxIVError', 'p99IVError': |solved - true IV| over converged contracts with vega >= minVega
+            - 'maxScaledIVError': max |solved - true IV|*min(1, vega/minVega) over the contracts the solver didn't skip (NaN IVs count as infinite),
+              leaving out ones with less than testEpsilon of time value (a wide range of IVs reprices those within testEpsilon)
+            - 'numContracts', and one count per BSMRootFinder.IV_STATUS_NAMES status, e.g., 'not converged'
+            - 'failed': contracts that weren't skipped, but didn't converge (including NaN IVs)
+            - 'meanIterations': mean number of pricings per contract that was solved
+            - 'passed': True if 'failed' <= maxFailures, and 'maxScaledIVError' <= maxIVError
+        '''
+        corpus = me.getCorpus()
+        brf = BSMRootFinder(normKernel=normKernel)
+        price, isCall, sigma, yte, S, K, r = (corpus[name] for name in ('price', 'isCall', 'sigma', 'yte', 'S', 'K', 'r'))
+        priorIVs = corpus['priorIV'] if warmStart else None
+        if forwardBased:
+            F, discountFactor = me.getForwards()
+            ivResults = brf.getBlack76IVResults(price, isCall, yte, F, K, discountFactor, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon,
+                                                method=method, priorIVs=priorIVs)
+            converged = ivResults['converged']
+            repriced = brf.bs.priceBlack76Options(isCall[converged], ivResults['iv'][converged], yte[converged], F[converged], K[converged],
+                                                  discountFactor[converged])
+        else:
+            ivResults = brf.getBSIVResults(price, isCall, yte, S, K, r, initialIVGuess=initialIVGuess, testEpsilon=testEpsilon, method=method,
+                                           priorIVs=priorIVs)
+            converged = ivResults['converged']
+            repriced = brf.bs.priceOptions(isCall[converged], ivResults['iv'][converged], yte[converged], S[converged], K[converged], r[converged])
+        priceErrors = np.abs(repriced - price[converged])
+        vegas = brf.getBSVega(S, K, yte, r, sigma)
+        ivErrors = np.abs(ivResults['iv'] - sigma)[converged & (vegas >= minVega)]
+        attempted = (ivResults['status'] == brf.QUOTE_OK) | (ivResults['status'] == brf.IV_NOT_CONVERGED)
+        scaledIVErrors = np.abs(ivResults['iv'] - sigma)*np.minimum(1.0, vegas/minVega)
+        scaledIVErrors = np.where(np.isnan(scaledIVErrors), np.inf, scaledIVErrors)
+        # A quote with less than testEpsilon of time value is repriced within testEpsilon by a wide range of IVs, so none of them is wrong.
+        intrinsicValues = np.maximum(np.where(isCall, S - K*np.exp(-r*yte), K*np.exp(-r*yte) - S), 0)
+        scaledIVErrors = scaledIVErrors[attempted & (price - intrinsicValues > testEpsilon)]
+        roundTrip = {'numContracts': len(price)}
+        for status, statusName in brf.IV_STATUS_NAMES.items():
+            roundTrip[statusName] = int(np.sum(ivResults['status'] == status))
+        solved = ivResults['iterations'] > 0
+        roundTrip['meanIterations'] = float(np.mean(ivResults['iterations'][solved])) if solved.any() else 0.0
+        roundTrip['maxPriceError'] = float(priceErrors.max()) if len(priceErrors) > 0 else np.nan
+        roundTrip['maxIVError'] = float(ivErrors.max()) if len(ivErrors) > 0 else np.nan
+        roundTrip['p99IVError'] = float(np.percentile(ivErrors, 99)) if len(ivErrors) > 0 else np.nan
+        roundTrip['maxScaledIVError'] = float(scaledIVErrors.max()) if len(scaledIVErrors) > 0 else 0.0
+        roundTrip['failed'] = int(np.sum(attempted & ~converged))
+        maxIVError = 2*testEpsilon/minVega if maxIVError is None else maxIVError
+        roundTrip['passed'] = roundTrip['failed'] <= maxFailures and roundTrip['maxScaledIVError'] <= maxIVError
+        return roundTrip
+
+    def run(me, batchSizes: tuple = (1, 1024), normKernels: tuple = NORM_KERNELS, ivMethods: tuple = IV_METHODS, verbose: bool = True):
+        '''
+        Runs every benchmark in every engine mode.
+        :return: dict with 'speed' (list of .timeBatches() dicts, each with its 'engine' and 'mode') and 'accuracy' (list of .checkRoundTrip() dicts,
+            each with its 'mode').
+        '''
+        speedResults = []
+        accuracyResults = []
+        for normKernel in normKernels:
+            for batchSize in batchSizes:
+                for fromTerms in (False, True):
+                    speedResults.append({'engine': 'price', 'mode': f"{normKernel}{', from terms' if fromTerms else ''}",
+                                         **me.benchmarkPricing(normKernel, batchSize, fromTerms=fromTerms)})
+                speedResults.append({'engine': 'price', 'mode': f"{normKernel}, black76", **me.benchmarkPricing(normKernel, batchSize, forwardBased=True)})
+                speedResults.append({'engine': 'greeks', 'mode': normKernel, **me.benchmarkGreeks(normKernel, batchSize)})
+                for method in ivMethods:
+                    for warmStart in ((False, True) if method != 'rational' else (False,)): # 'rational' doesn't use priors.
+                        speedResults.append({'engine': 'iv', 'mode': f"{normKernel}, {method}, {'warm' if warmStart else 'cold'}",
+                                             **me.benchmarkIV(normKernel, method, batchSize, warmStart=warmStart)})
+                    speedResults.append({'engine': 'iv', 'mode': f"{normKernel}, {method}, cold, black76",
+                                         **me.benchmarkIV(normKernel, method, batchSize, forwardBased=True)})
+            for method in ivMethods:
+                for warmStart in ((False, True) if method != 'rational' else (False,)):
+                    accuracyResults.append({'mode': f"{normKernel}, {method}, {'warm' if warmStart else 'cold'}",
+                                            **me.checkRoundTrip(normKernel, method, warmStart=warmStart)})
+                accuracyResults.append({'mode': f"{normKernel}, {method}, cold, black76", **me.checkRoundTrip(normKernel, method, forwardBased=True)})
+        if verbose:
+            me.printResults(speedResults, accuracyResults)
+        return {'speed': speedResults, 'accuracy': accuracyResults}
+
+    def printResults(me, speedResults: list, accuracyResults: list):
+        print(f"Corpus: {len(me.getCorpus()['price'])} contracts")
+        print(f"{'engine':<8}{'mode':<36}{'batch':>7}{'contracts/s':>14}{'p50 ms':>10}{'p99 ms':>10}")
+        for result in speedResults:
+            print(f"{result['engine']:<8}{result['mode']:<36}{result['batchSize']:>7}{result['contractsPerSecond']:>14,.0f}"
+                  f"{result['p50Ms']:>10.3f}{result['p99Ms']:>10.3f}")
+        print(f"\n{'mode':<36}{'passed':>7}{'max price err':>15}{'max IV err':>12}{'p99 IV err':>12}{'scaled IV err':>15}{'iters':>7}"
+              f"{'failed':>8}{'skipped':>9}")
+        for result in accuracyResults:
+            numSkipped = result['numContracts'] - result['ok'] - result['not converged']
+            print(f"{result['mode']:<36}{str(result['passed']):>7}{result['maxPriceError']:>15.2e}{result['maxIVError']:>12.2e}"
+                  f"{result['p99IVError']:>12.2e}{result['maxScaledIVError']:>15.2e}{result['meanIterations']:>7.1f}{result['failed']:>8}"
+                  f"{numSkipped:>9}")
+
+
+if __name__ == "__main__":
+    ''' Runs the full benchmark. Pass a path to save the corpus to (or load it from, if it exists), so later runs use the same contracts. '''
+    import os
+    import sys
+
+    benchmark = SolverBenchmark()
+    if len(sys.argv) > 1:
+        if os.path.exists(sys.argv[1]):
+            benchmark.loadCorpus(sys.argv[1])
+        else:
+            benchmark.saveCorpus(sys.argv[1])
+    benchmark.run()
@@ -1,5 +1,6 @@
 from ib_insync import IB, util, Index, Stock
 
+from src.LiveIVSurface import LiveIVSurface
 from src.OptionChain import OptionChain
 from src.VolatilityViewer import VolatilityViewer
 
@@ -14,11 +15,17 @@ if __name__ == "__main__":
     
     If reqNewData is True, as of now, 1 day of hourly option midpoint price bars are pulled from IB,
     along with one day of the underlying's hourly bars.
+    If incrementalRefresh is also True, only the bars since the last stored ones are requested, and appended to the store.
     
-    Data is saved in pickled files instead of SQLite for initial setup purposes;
-    ideally, a database would be used.
+    Data is saved in one columnar .npz file per chain and snapshot date (see ChainBarStore),
+    falling back to the older per-contract pickled files if there's no store file for the snapshot date.
+    If a database is passed to OptionChain (see OptionDatabase), requested chains, contracts, and bars are also saved to it,
+    so they can be queried across snapshots.
     
     Option implied volatilities are then calculated for the under
+
+    If streamLiveIVs is True, the IV surface is then kept up to date from live quotes instead (see LiveIVSurface),
+    and printed every publishIntervalSeconds.
     
     
     Because this isn't production code, there is not enough error checking here, and printing should be done with a logger instead.
@@ -26,6 +33,8 @@ if __name__ == "__main__":
     # Flags
     reqNewOptionChains = False
     reqNewData = False
+    incrementalRefresh = False
+    streamLiveIVs = False
 
     util.startLoop()
 
@@ -45,7 +54,7 @@ if __name__ == "__main__":
 
     print(oc.chain)
 
-    oc.createOptionContracts(reqNewData=reqNewData)
+    oc.createOptionContracts(reqNewData=reqNewData, incremental=incrementalRefresh)
     oc.getDaysToExpiry()
     ivMatrix = oc.calculateIVs('C', r=r)
 
@@ -54,6 +63,8 @@ if __name__ == "__main__":
 
     volViewer = VolatilityViewer(daysToExpiry=oc.daysToExpiryList, strikes=oc.strikes, impliedVols=ivMatrix)
 
-
-
-
+    if streamLiveIVs:
+        liveIVSurface = LiveIVSurface(ib, oc, right='C', r=r, publishIntervalSeconds=5,
+                                      onPublish=lambda surface: print(f"Underlying: {surface['underlyingPrice']}\n{surface['ivMatrix']}"))
+        liveIVSurface.start()
+        ib.run() # Runs the event loop until interrupted.
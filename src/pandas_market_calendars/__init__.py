@@ -14,18 +14,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import pkg_resources
-
 from .calendar_registry import get_calendar, get_calendar_names
-from .calendar_utils import convert_freq, date_range, merge_schedules
+from .calendar_utils import convert_freq, date_range, date_range_int64, merge_schedules, session_boundaries_int64
 # TODO: is the below needed? Can I replace all the imports on the calendars with ".market_calendar"
 from .market_calendar import MarketCalendar
 
-# if running in development there may not be a package
-try:
-    __version__ = pkg_resources.get_distribution('pandas_market_calendars').version
-except pkg_resources.DistributionNotFound:
-    __version__ = 'development'
+
+def __getattr__(name):
+    # __version__ is looked up on first use, since importing pkg_resources takes longer than importing the rest of the package
+    if name == '__version__':
+        import pkg_resources
+
+        # if running in development there may not be a package
+        try:
+            return pkg_resources.get_distribution('pandas_market_calendars').version
+        except pkg_resources.DistributionNotFound:
+            return 'development'
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
 
 __all__ = [
     'MarketCalendar',
@@ -33,5 +39,7 @@ __all__ = [
     'get_calendar_names',
     'merge_schedules',
     'date_range',
+    'date_range_int64',
+    'session_boundaries_int64',
     'convert_freq'
 ]
@@ -1,24 +1,33 @@
 from .market_calendar import MarketCalendar
-from .exchange_calendar_asx import ASXExchangeCalendar
-from .exchange_calendar_bmf import BMFExchangeCalendar
-from .exchange_calendar_cfe import CFEExchangeCalendar
-from .exchange_calendar_cme import \
-    CMEExchangeCalendar, \
-    CMEAgricultureExchangeCalendar, \
-    CMEEquityExchangeCalendar, \
-    CMEBondExchangeCalendar
-from .exchange_calendar_eurex import EUREXExchangeCalendar
-from .exchange_calendar_hkex import HKEXExchangeCalendar
-from .exchange_calendar_ice import ICEExchangeCalendar
-from .exchange_calendar_jpx import JPXExchangeCalendar
-from .exchange_calendar_lse import LSEExchangeCalendar
-from .exchange_calendar_nyse import NYSEExchangeCalendar
-from .exchange_calendar_ose import OSEExchangeCalendar
-from .exchange_calendar_six import SIXExchangeCalendar
-from .exchange_calendar_sse import SSEExchangeCalendar
-from .exchange_calendar_tsx import TSXExchangeCalendar
-from .exchange_calendar_bse import BSEExchangeCalendar
-from .exchange_calendar_tase import TASEExchangeCalendar
+
+# Name and aliases of each calendar -> the module that defines it. The exchange modules (and their holiday lists) are only
+# imported when get_calendar() is first asked for one of their calendars, so importing the package doesn't import all of them.
+# Keep the names in sync with each calendar's aliases.
+_CALENDAR_MODULES = [
+    ('.exchange_calendar_asx', ['ASX']),
+    ('.exchange_calendar_bmf', ['BMF']),
+    ('.exchange_calendar_cfe', ['CFE']),
+    ('.exchange_calendar_nyse', ['NYSE', 'stock', 'NASDAQ', 'BATS', 'AMEX', 'CBOE']),
+    ('.exchange_calendar_cme', ['CME', 'CBOT', 'COMEX', 'NYMEX',
+                                'CME_Equity', 'CBOT_Equity', 'GLOBEX',
+                                'CME_Agriculture', 'CBOT_Agriculture', 'COMEX_Agriculture', 'NYMEX_Agriculture',
+                                'CME_Rate', 'CBOT_Rate', 'CME_InterestRate', 'CBOT_InterestRate', 'CME_Bond', 'CBOT_Bond']),
+    ('.exchange_calendar_eurex', ['EUREX']),
+    ('.exchange_calendar_hkex', ['HKEX']),
+    ('.exchange_calendar_ice', ['ICE', 'ICEUS', 'NYFE']),
+    ('.exchange_calendar_jpx', ['JPX']),
+    ('.exchange_calendar_lse', ['LSE']),
+    ('.exchange_calendar_ose', ['OSE']),
+    ('.exchange_calendar_six', ['SIX']),
+    ('.exchange_calendar_sse', ['SSE']),
+    ('.exchange_calendar_tsx', ['TSX', 'TSXV']),
+    ('.exchange_calendar_bse', ['BSE']),
+    ('.exchange_calendar_tase', ['TASE']),
+]
+
+for _module, _names in _CALENDAR_MODULES:
+    for _name in _names:
+        MarketCalendar._regmeta_register_lazy(_name, __package__ + _module)
 #from .trading_calendars_mirror import *
 
 
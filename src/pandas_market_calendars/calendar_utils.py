@@ -4,6 +4,7 @@ Utilities to use with market_calendars
 import itertools
 import warnings
 
+import numpy as np
 import pandas as pd
 
 
@@ -59,12 +60,17 @@ def date_range(schedule, frequency, closed='right', force_close=True, timezone="
       results should only include the close for each bar.
     :param force_close: if True then the close of the day will be included even if it does not fall on an even
       frequency. If False then the market close for the day may not be included in the results
-    :param kwargs: arguments that will be passed to the pandas date_time
+    :param timezone: time zone of the schedule's times if they are naive; tz-aware ones must already be in it, or pandas
+      raises. The results are in UTC either way
+    :param kwargs: arguments that will be passed to the pandas date_time. If there are any, the dates are built one
+      day at a time with pandas date_range, rather than with date_range_int64()
     :return: DatetimeIndex
     """
 
     if pd.Timedelta(frequency) > pd.Timedelta('1D'):
         raise ValueError('Frequency must be 1D or higher frequency.')
+    if not kwargs:
+        return pd.DatetimeIndex(date_range_int64(schedule, frequency, closed, force_close, timezone), tz='UTC')
     kwargs['closed'] = closed
     ranges = list()
     breaks = 'break_start' in schedule.columns
@@ -85,3 +91,102 @@ def date_range(schedule, frequency, closed='right', force_close=True, timezone="
 
     index = pd.DatetimeIndex([], tz='UTC')
     return index.union_many(ranges)
+
+
+def date_range_int64(schedule, frequency, closed='right', force_close=True, timezone='UTC'):
+    """
+    Same dates as date_range(), as sorted, unique int64 nanoseconds since the epoch (UTC), built for the whole schedule
+    at once with numpy, instead of one pandas date_range per day.
+
+    :param schedule: schedule DataFrame
+    :param frequency: frequency in standard string (a fixed length, 1D or less)
+    :param closed: see date_range()
+    :param force_close: see date_range()
+    :param timezone: see date_range(): the time zone of a naive schedule, which a tz-aware schedule's must be the same as
+    :return: numpy int64 array
+    """
+    if pd.Timedelta(frequency) > pd.Timedelta('1D'):
+        raise ValueError('Frequency must be 1D or higher frequency.')
+    opens, closes = _utc_values(schedule['market_open'], timezone), _utc_values(schedule['market_close'], timezone)
+    dates, sessions, steps = _session_grid(opens, closes, pd.Timedelta(frequency).value)
+    # As in pandas date_range: 'right' leaves out each day's open, and 'left' its close, unless they're the same time.
+    single = opens[sessions] == closes[sessions]
+    if closed == 'right':
+        keep = (steps != 0) | single
+    elif closed == 'left':
+        keep = (dates != closes[sessions]) | single
+    else:
+        keep = np.ones(len(dates), dtype=bool)
+    dates, sessions = dates[keep], sessions[keep]
+    if force_close:
+        has_close = np.zeros(len(schedule), dtype=bool)
+        has_close[sessions[dates == closes[sessions]]] = True
+        dates = np.concatenate([dates, closes[~has_close]])
+        sessions = np.concatenate([sessions, np.nonzero(~has_close)[0]])
+    if 'break_start' in schedule.columns:
+        # Comparisons with NaT are False, so, as in date_range(), a day without break times keeps nothing
+        break_start = _utc_values(schedule['break_start'], timezone)[sessions]
+        break_end = _utc_values(schedule['break_end'], timezone)[sessions]
+        if closed == 'right':
+            dates = dates[(dates <= break_start) | (break_end < dates)]
+        elif closed == 'left':
+            dates = dates[(dates < break_start) | (break_end <= dates)]
+        else:
+            dates = dates[(dates <= break_start) | (break_end <= dates)]
+    return np.unique(dates.view(np.int64))
+
+
+def session_boundaries_int64(schedule, frequency, force_close=True):
+    """
+    Every bar boundary of every day in the schedule: market_open + k * frequency (k = 0, 1, ...) up to market_close,
+    then market_close itself, if force_close and it isn't one of them. Consecutive boundaries of the same day are the
+    (start, end) of that day's bars. Breaks are ignored; date_range_int64() leaves them out.
+
+    :param schedule: schedule DataFrame
+    :param frequency: frequency in standard string (a fixed length, 1D or less)
+    :param force_close: if True then each day's close is a boundary even if it does not fall on an even frequency
+    :return: tuple of numpy int64 arrays (boundaries, sessions): the boundaries as nanoseconds since the epoch (UTC),
+      in schedule order, and the position in the schedule of the day each one belongs to
+    """
+    if pd.Timedelta(frequency) > pd.Timedelta('1D'):
+        raise ValueError('Frequency must be 1D or higher frequency.')
+    opens, closes = _utc_values(schedule['market_open']), _utc_values(schedule['market_close'])
+    boundaries, sessions, _ = _session_grid(opens, closes, pd.Timedelta(frequency).value)
+    if force_close:
+        last = np.zeros(len(schedule), dtype=boundaries.dtype)
+        counts = np.bincount(sessions, minlength=len(schedule))
+        has_boundaries = counts > 0
+        last[has_boundaries] = boundaries[(np.cumsum(counts) - 1)[has_boundaries]]
+        off_grid = np.nonzero(~has_boundaries | (last < closes))[0]
+        # Each forced close goes right after its day's last boundary
+        positions = np.cumsum(counts)[off_grid]
+        boundaries = np.insert(boundaries, positions, closes[off_grid])
+        sessions = np.insert(sessions, positions, off_grid)
+    return boundaries.view(np.int64), sessions
+
+
+def _session_grid(opens, closes, step):
+    """
+    :param opens: datetime64[ns] array of each day's open
+    :param closes: datetime64[ns] array of each day's close
+    :param step: nanoseconds between boundaries
+    :return: tuple (dates, sessions, steps): open + k * step, for k = 0, 1, ... up to each day's close, as datetime64[ns];
+      the position of the day each date belongs to; and its k
+    """
+    open_values = opens.view(np.int64)
+    counts = np.maximum((closes.view(np.int64) - open_values) // step + 1, 0)
+    sessions = np.repeat(np.arange(len(counts)), counts)
+    steps = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (open_values[sessions] + steps * step).view('datetime64[ns]'), sessions, steps
+
+
+def _utc_values(column, timezone=None):
+    """
+    :param timezone: if given, naive times are in this time zone, and tz-aware ones must already be in it (as with the
+      tz of pandas date_range, which raises if they aren't)
+    :return: numpy datetime64[ns] array (UTC) of a schedule column
+    """
+    index = pd.DatetimeIndex(column, tz=timezone)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.values.astype('datetime64[ns]')
@@ -1,14 +1,20 @@
+import importlib
+
+
 def _regmeta_class_factory(cls, name):
     """
     :param cls(RegisteryMeta): registration meta class
     :param name(str): name of class
     :return: class
     """
+    if name not in cls._regmeta_class_registry and name in cls._regmeta_lazy_registry:
+        # Importing the module defines the class, which registers it (and its aliases)
+        importlib.import_module(cls._regmeta_lazy_registry[name])
     if name in cls._regmeta_class_registry:
         return cls._regmeta_class_registry[name]
     else:
         raise RuntimeError(
-            'Class {} is not one of the registered classes: {}'.format(name, cls._regmeta_class_registry.keys()))
+            'Class {} is not one of the registered classes: {}'.format(name, cls._regmeta_classes()))
 
 
 def _regmeta_instance_factory(cls, name, *args, **kwargs):
@@ -38,8 +44,20 @@ def _regmeta_register_class(cls, regcls, name):
         cls._regmeta_class_registry[name] = regcls
 
 
+def _regmeta_register_lazy(cls, name, module):
+    """
+    Registers a name for a class that isn't defined yet; the module is imported the first time the name is asked for.
+
+    :param cls(RegisteryMeta): registration base class
+    :param name(str): name (or alias) that the class will be registered under
+    :param module(str): absolute name of the module that defines the class
+    """
+    cls._regmeta_lazy_registry[name] = module
+
+
 def _regmeta_classes(cls):
-    return list(cls._regmeta_class_registry.keys())
+    names = list(cls._regmeta_lazy_registry.keys())
+    return names + [name for name in cls._regmeta_class_registry.keys() if name not in cls._regmeta_lazy_registry]
 
 
 class RegisteryMeta(type):
@@ -52,9 +70,11 @@ class RegisteryMeta(type):
 
         if not hasattr(cls, '_regmeta_class_registry'):
             cls._regmeta_class_registry = {}
+            cls._regmeta_lazy_registry = {}
             cls._regmeta_class_factory = classmethod(_regmeta_class_factory)
             cls._regmeta_instance_factory = classmethod(_regmeta_instance_factory)
             cls._regmeta_classes = classmethod(_regmeta_classes)
+            cls._regmeta_register_lazy = classmethod(_regmeta_register_lazy)
 
         return cls
 
@@ -6,8 +6,6 @@ from pytz import timezone
 from .holidays_oz import *
 from .market_calendar import MarketCalendar
 
-AbstractHolidayCalendar.start_date = '2011-01-01'
-
 
 class ASXExchangeCalendar(MarketCalendar):
 	"""
@@ -6,7 +6,7 @@ from pandas.tseries.holiday import AbstractHolidayCalendar, EasterMonday, GoodFr
 from pandas.tseries.offsets import LastWeekOfMonth, WeekOfMonth
 from pytz import timezone
 
-from resources.pandas_market_calendars.holidays_us import USNewYearsDay
+from .holidays_us import USNewYearsDay
 from .holidays_cn import bsd_mapping, dbf_mapping, dnf_mapping, maf_mapping, sf_mapping, tsd_mapping
 from .market_calendar import MarketCalendar
 
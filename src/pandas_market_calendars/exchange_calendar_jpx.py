@@ -4,8 +4,8 @@ from itertools import chain
 from pandas.tseries.holiday import AbstractHolidayCalendar
 from pytz import timezone
 
-from resources.pandas_market_calendars.holidays_jp import *
-from resources.pandas_market_calendars.holidays_us import USNewYearsDay
+from .holidays_jp import *
+from .holidays_us import USNewYearsDay
 from .market_calendar import MarketCalendar
 
 
@@ -19,7 +19,7 @@ from itertools import chain
 from pandas.tseries.holiday import AbstractHolidayCalendar, GoodFriday, USLaborDay
 from dateutil.tz import gettz, tz
 
-from resources.pandas_market_calendars.holidays_us import (August45VictoryOverJapan, Christmas, ChristmasBefore1954,
+from .holidays_us import (August45VictoryOverJapan, Christmas, ChristmasBefore1954,
                                                  ChristmasEveBefore1993, ChristmasEveInOrAfter1993, ChristmasEvesAdhoc,
                                                  DayAfterChristmasAdhoc, DayAfterIndependenceDayAdhoc,
                                                  DayBeforeDecorationAdhoc, FirstLunarLandingClosing,
@@ -43,9 +43,6 @@ from .market_calendar import MarketCalendar
 # http://www.nyse.com/pdfs/closings.pdf
 # http://www.stevemorse.org/jcal/whendid.html
 
-# Overwrite the default holiday calendar start_date of 1/1/70 with 1/1/1900
-AbstractHolidayCalendar.start_date = '1900-01-01'
-
 
 class NYSEExchangeCalendar(MarketCalendar):
     """
@@ -0,0 +1,158 @@
+"""
+Precompiled holiday and special open/close tables for the registered calendars.
+
+Evaluating the pandas AbstractHolidayCalendar rules is the slow part of building a schedule: holidays() builds a
+CustomBusinessDay from every rule over 1970-2200, and every schedule() evaluates the special open/close rules again.
+build_holiday_tables() evaluates them once, over a fixed horizon, and saves the results as int64 day numbers
+(days since 1970-01-01) in one .npz file, keyed by calendar class name:
+    - '<class>.holidays': regular and ad-hoc holidays
+    - '<class>.special_opens.<i>' / '<class>.special_closes.<i>': the dates of the i-th (time, AbstractHolidayCalendar) rule
+    - '<class>.special_opens.times' / '<class>.special_closes.times': each rule's time, as seconds since midnight, so a
+      table isn't used if the calendar's rules have changed since the file was built
+    - 'horizon': first and last day covered
+
+MarketCalendar loads the file the first time it needs it, and falls back to evaluating the rules for any date range
+that isn't inside the horizon, for calendars that aren't in the file, or if the file doesn't exist.
+
+To (re)build the file, after changing any calendar's rules:
+    python -m pandas_market_calendars.holiday_tables
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+TABLES_PATH = os.path.join(os.path.dirname(__file__), 'holiday_tables.npz')
+HORIZON_START = '2000-01-01'
+HORIZON_END = '2040-12-31'
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+_tables = None
+
+
+def load_holiday_tables(path=TABLES_PATH, reload=False):
+    """
+    :return: dict of table name -> int64 array (empty if the file doesn't exist), read from disk on the first call only.
+    """
+    global _tables
+    if _tables is None or reload:
+        _tables = {}
+        if os.path.exists(path):
+            with np.load(path) as npz:
+                _tables = {name: npz[name] for name in npz.files}
+    return _tables
+
+
+def to_day(date):
+    """
+    :return: int day number (days since 1970-01-01) of a date, Timestamp, or date string; any time and time zone are dropped.
+    """
+    return pd.Timestamp(date).tz_localize(None).normalize().value // NS_PER_DAY
+
+
+def days_to_index(days):
+    """
+    :return: DatetimeIndex (midnight, no time zone) of int64 day numbers
+    """
+    return pd.DatetimeIndex(np.asarray(days, dtype=np.int64).astype('datetime64[D]'))
+
+
+def covers(start_date, end_date):
+    """
+    :return: True if every date from start_date to end_date is inside the horizon of the loaded tables.
+    """
+    horizon = load_holiday_tables().get('horizon', None)
+    return horizon is not None and horizon[0] <= to_day(start_date) and to_day(end_date) <= horizon[1]
+
+
+def get_holiday_days(calendar):
+    """
+    :return: int64 day numbers of all of the calendar's holidays inside the horizon, or None if there's no table for it.
+    """
+    return load_holiday_tables().get(type(calendar).__name__ + '.holidays', None)
+
+
+def get_special_days(calendar, kind, rules, start_date, end_date):
+    """
+    :param kind: 'special_opens' or 'special_closes'
+    :param rules: the calendar's current list of (time, AbstractHolidayCalendar) for kind
+    :return: list with one DatetimeIndex of dates (start_date to end_date) per rule, or None if the tables can't be used
+        (no table for the calendar, the rules' times don't match the ones the table was built with, or the dates aren't inside the horizon).
+    """
+    tables = load_holiday_tables()
+    prefix = '%s.%s' % (type(calendar).__name__, kind)
+    times = tables.get(prefix + '.times', None)
+    if times is None or not covers(start_date, end_date):
+        return None
+    if len(times) != len(rules) or any(time_to_seconds(time_) != seconds for (time_, _), seconds in zip(rules, times)):
+        return None
+    start_day, end_day = to_day(start_date), to_day(end_date)
+    special_days = []
+    for i in range(len(rules)):
+        days = tables[prefix + '.%d' % i]
+        special_days.append(days_to_index(days[np.searchsorted(days, start_day):np.searchsorted(days, end_day, side='right')]))
+    return special_days
+
+
+def time_to_seconds(time_):
+    return time_.hour * 3600 + time_.minute * 60 + time_.second
+
+
+def _rule_days(holiday_calendar, start, end):
+    """
+    Day numbers of an AbstractHolidayCalendar's holidays from start to end. The rules are evaluated a year past the horizon
+    on each side, so that observance (e.g., a Saturday holiday observed on the Friday before) near the edges is the same as it
+    would be for any date range.
+    """
+    try:
+        dates = holiday_calendar.holidays(start - pd.DateOffset(years=1), end + pd.DateOffset(years=1))
+    except ValueError:  # Same as holidays_at_time()
+        dates = pd.DatetimeIndex([])
+    return _to_days(dates, start, end)
+
+
+def _to_days(dates, start, end):
+    if len(dates) == 0:
+        return np.empty(0, dtype=np.int64)
+    # One at a time, because some ad-hoc holiday lists mix tz-aware and naive dates; aware ones keep their local date.
+    days = np.unique(np.array([to_day(date) for date in dates], dtype=np.int64))
+    return days[(to_day(start) <= days) & (days <= to_day(end))]
+
+
+def build_holiday_tables(path=TABLES_PATH, start_date=HORIZON_START, end_date=HORIZON_END):
+    """
+    Compiles the holidays and special open/close dates of every registered calendar, from start_date to end_date,
+    and saves them to path (see the module docstring).
+
+    :return: dict of the arrays that were saved
+    """
+    from .calendar_registry import get_calendar, get_calendar_names
+
+    start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    arrays = {'horizon': np.array([to_day(start), to_day(end)], dtype=np.int64)}
+    for name in get_calendar_names():
+        try:
+            calendar = get_calendar(name)
+        except Exception:  # Calendars that can't be constructed can't be used either; nothing to compile.
+            continue
+        class_name = type(calendar).__name__
+        if class_name + '.holidays' in arrays:  # Aliases of a calendar that's already been compiled.
+            continue
+        holiday_days = [_to_days(calendar.adhoc_holidays, start, end)]
+        if calendar.regular_holidays is not None:
+            holiday_days.append(_rule_days(calendar.regular_holidays, start, end))
+        arrays[class_name + '.holidays'] = np.unique(np.concatenate(holiday_days))
+        for kind in ('special_opens', 'special_closes'):
+            rules = getattr(calendar, kind)
+            arrays['%s.%s.times' % (class_name, kind)] = np.array([time_to_seconds(time_) for time_, _ in rules], dtype=np.int64)
+            for i, (_, holiday_calendar) in enumerate(rules):
+                arrays['%s.%s.%d' % (class_name, kind, i)] = _rule_days(holiday_calendar, start, end)
+    np.savez(path, **arrays)
+    if path == TABLES_PATH:
+        load_holiday_tables(reload=True)
+    return arrays
+
+
+if __name__ == '__main__':
+    built = build_holiday_tables()
+    print('Saved %d tables (%d calendars) to %s' % (len(built), sum(name.endswith('.holidays') for name in built), TABLES_PATH))
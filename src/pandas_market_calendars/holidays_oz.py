@@ -3,7 +3,7 @@
 from pandas import DateOffset
 from pandas.tseries.holiday import Holiday, MO, weekend_to_monday
 
-from resources.pandas_market_calendars.market_calendar import MONDAY, TUESDAY
+from .market_calendar import MONDAY, TUESDAY
 
 # New Year's Day
 OZNewYearsDay = Holiday(
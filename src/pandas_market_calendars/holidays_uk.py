@@ -4,7 +4,7 @@ import pandas as pd
 from pandas import DateOffset, Timestamp
 from pandas.tseries.holiday import Holiday, MO, previous_friday, weekend_to_monday
 
-from resources.pandas_market_calendars.market_calendar import MONDAY, TUESDAY
+from .market_calendar import MONDAY, TUESDAY
 
 # New Year's Eve
 LSENewYearsEve = Holiday(
@@ -3,7 +3,7 @@ from pandas import (DateOffset, Timestamp, date_range)
 from pandas.tseries.holiday import (Holiday, nearest_workday, sunday_to_monday)
 from pandas.tseries.offsets import Day
 
-from resources.pandas_market_calendars.market_calendar import (FRIDAY, MONDAY, THURSDAY, TUESDAY, WEDNESDAY)
+from .market_calendar import (FRIDAY, MONDAY, THURSDAY, TUESDAY, WEDNESDAY)
 
 
 # These have the same definition, but are used in different places because the
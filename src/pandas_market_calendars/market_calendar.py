@@ -15,18 +15,27 @@
 # limitations under the License.
 
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
 from datetime import timedelta
 from itertools import compress
 
+import numpy as np
 import pandas as pd
 from dateutil.tz import tz
 from pandas import DataFrame, DatetimeIndex
+from pandas.tseries.holiday import AbstractHolidayCalendar
 from pandas.tseries.offsets import CustomBusinessDay
 
+from . import holiday_tables
 from .class_registry import RegisteryMeta
 
 MONDAY, TUESDAY, WEDNESDAY, THURSDAY, FRIDAY, SATURDAY, SUNDAY = range(7)
 
+# Overwrite the default holiday calendar start_date of 1/1/70 with 1/1/1900, for every calendar. This is set once, here,
+# and not in the exchange modules, which are imported lazily: otherwise the holidays of every calendar would depend on
+# which exchange module happened to be imported last.
+AbstractHolidayCalendar.start_date = '1900-01-01'
+
 
 class MarketCalendarMeta(ABCMeta, RegisteryMeta):
     pass
@@ -46,6 +55,7 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
         self._open_time = self.open_time_default if open_time is None else open_time
         self._close_time = self.close_time_default if close_time is None else close_time
         self._holidays = None
+        self._compiled_holidays = None
 
     @classmethod
     def factory(cls, name, open_time=None, close_time=None):
@@ -232,9 +242,26 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
         :param tz: time zone in either string or pytz.timezone
         :return: DatetimeIndex of valid business days
         """
-        return pd.date_range(start_date, end_date, freq=self.holidays(), normalize=True, tz=tz)
+        return pd.date_range(start_date, end_date, freq=self._holidays_for_range(start_date, end_date), normalize=True, tz=tz)
+
+    def _holidays_for_range(self, start_date, end_date):
+        """
+        The same as holidays() for dates from start_date to end_date, but built from the precompiled holiday table
+        (see holiday_tables) when the dates are inside its horizon, so that no holiday rules need to be evaluated.
+        """
+        if not holiday_tables.covers(start_date, end_date):
+            return self.holidays()
+        if self._compiled_holidays is None:
+            holiday_days = holiday_tables.get_holiday_days(self)
+            if holiday_days is None:
+                return self.holidays()
+            self._compiled_holidays = CustomBusinessDay(
+                holidays=holiday_days.astype('datetime64[D]'),
+                weekmask=self.weekmask,
+            )
+        return self._compiled_holidays
 
-    def schedule(self, start_date, end_date, tz='UTC'):
+    def schedule(self, start_date, end_date, tz='UTC', use_cache=False):
         """
         Generates the schedule DataFrame. The resulting DataFrame will have all the valid business days as the index
         and columns for the market opening datetime (market_open) and closing datetime (market_close). All time zones
@@ -244,18 +271,36 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
         :param start_date: start date
         :param end_date: end date
         :param tz: timezone
+        :param use_cache: if True, the schedule is sliced out of a wider one that is built once per calendar and timezone,
+            and kept in schedule_cache (see ScheduleCache), instead of being rebuilt from the holiday rules on every call.
         :return: schedule DataFrame
         """
         start_date, end_date = clean_dates(start_date, end_date)
         if not (start_date <= end_date):
             raise ValueError('start_date must be before or equal to end_date.')
+        if use_cache:
+            return schedule_cache.get_schedule(self, start_date, end_date, tz=tz)
+        return self._build_schedule(start_date, end_date, tz)
+
+    def schedule_cache_key(self):
+        """
+        Calendars that build the same schedules share a key in the ScheduleCache.
+
+        :return: hashable key
+        """
+        # dateutil tzinfos aren't hashable, so neither are times that have one.
+        return (self.__class__,) + tuple((t.replace(tzinfo=None), repr(t.tzinfo)) for t in (self.open_time, self.close_time))
 
+    def _build_schedule(self, start_date, end_date, tz):
+        """
+        The uncached part of schedule(), for dates that have already been cleaned.
+        """
         # Setup all valid trading days
         _all_days = self.valid_days(start_date, end_date)
 
         # If no valid days return an empty DataFrame
         if len(_all_days) == 0:
-            return pd.DataFrame(columns=['market_open', 'market_close'], index=pd.DatetimeIndex([], freq='C'))
+            return _empty_schedule()
 
         # `DatetimeIndex`s of standard opens/closes for each day.
         opens = days_at_time(_all_days, self.open_time, self.tz, self.open_offset).tz_convert(tz)
@@ -342,7 +387,59 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
                 return True
         return False
 
+    @staticmethod
+    def open_at_times(schedule, timestamps, include_close=False):
+        """
+        Vectorized open_at_time(): the same checks (including breaks, and sessions that open on the previous calendar day),
+        for every timestamp at once. Each timestamp's UTC date (and the date after it) are looked up in the schedule's index
+        with searchsorted, rather than one schedule.loc lookup at a time, so it scales to millions of timestamps.
 
+        :param schedule: schedule DataFrame
+        :param timestamps: DatetimeIndex (or anything pd.DatetimeIndex() accepts), or int64 nanoseconds since the epoch (UTC).
+            Naive timestamps are taken to be UTC. They don't need to be sorted.
+        :param include_close: see open_at_time()
+        :return: numpy bool array, True where the timestamp is a valid open date and time
+        """
+        if isinstance(timestamps, np.ndarray) and timestamps.dtype.kind in 'iu':
+            times = timestamps.astype('datetime64[ns]')
+        else:
+            times = _to_utc_datetime64(timestamps)
+        is_open = np.zeros(len(times), dtype=bool)
+        if len(schedule) == 0 or len(times) == 0:
+            return is_open
+        if not schedule.index.is_monotonic_increasing:
+            schedule = schedule.sort_index()
+        schedule_days = schedule.index.values.astype('datetime64[D]')
+        opens = _to_utc_datetime64(schedule['market_open'])
+        closes = _to_utc_datetime64(schedule['market_close'])
+        days = times.astype('datetime64[D]')
+
+        def find(days):
+            # Position of each day in the schedule, and whether it's actually there
+            positions = np.minimum(np.searchsorted(schedule_days, days), len(schedule_days) - 1)
+            return positions, schedule_days[positions] == days
+
+        # The timestamp's own date: open <= timestamp <= close, then the break and close checks.
+        # Comparisons with NaT (e.g., a day without a break) are False, as they are in open_at_time().
+        positions, found = find(days)
+        market_open, market_close = opens[positions], closes[positions]
+        in_session = found & (market_open <= times) & (times <= market_close)
+        if 'break_start' in schedule.columns:
+            break_start = _to_utc_datetime64(schedule['break_start'])[positions]
+            break_end = _to_utc_datetime64(schedule['break_end'])[positions]
+            if include_close:
+                in_session &= (times <= break_start) | (break_end <= times)
+            else:
+                in_session &= (times < break_start) | ((break_end <= times) & (times < market_close))
+        elif not include_close:
+            in_session &= times < market_close
+        is_open |= in_session
+
+        # The next date (e.g., futures that reopen in the evening): open if that date's market_open has passed.
+        # (The timestamp is always before the next date's midnight.)
+        positions, found = find(days + np.timedelta64(1, 'D'))
+        is_open |= found & (opens[positions] <= times)
+        return is_open
 
     # need this to make is_open_now testable
     @staticmethod
@@ -374,19 +471,25 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
         match_dates = schedule['market_close'].apply(lambda x: x.tz_convert(self.tz).time() != self.close_time)
         return schedule[match_dates]
 
-    def _special_dates(self, calendars, ad_hoc_dates, start_date, end_date):
+    def _special_dates(self, calendars, ad_hoc_dates, start_date, end_date, kind=None):
         """
         Union an iterable of pairs of the form (time, calendar)
         and an iterable of pairs of the form (time, [dates])
 
         (This is shared logic for computing special opens and special closes.)
+
+        :param kind: 'special_opens' or 'special_closes', to look up the calendars' dates in the precompiled tables
+            (see holiday_tables) instead of evaluating their rules, when possible.
         """
+        compiled_days = None
+        if kind is not None:
+            compiled_days = holiday_tables.get_special_days(self, kind, calendars, start_date, end_date)
+        if compiled_days is not None:
+            calendar_dates = [days_at_time(days, time_, self.tz) for (time_, _), days in zip(calendars, compiled_days)]
+        else:
+            calendar_dates = [holidays_at_time(calendar, start_date, end_date, time_, self.tz) for time_, calendar in calendars]
         _dates = DatetimeIndex([], tz='UTC').union_many(
-            [
-                holidays_at_time(calendar, start_date, end_date, time_,
-                                 self.tz)
-                for time_, calendar in calendars
-            ] + [
+            calendar_dates + [
                 days_at_time(datetimes, time_, self.tz)
                 for time_, datetimes in ad_hoc_dates
             ]
@@ -402,6 +505,7 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
             self.special_opens_adhoc,
             start,
             end,
+            kind='special_opens',
         )
 
     def _calculate_special_closes(self, start, end):
@@ -410,9 +514,97 @@ class MarketCalendar(metaclass=MarketCalendarMeta):
             self.special_closes_adhoc,
             start,
             end,
+            kind='special_closes',
         )
 
 
+class ScheduleCache(object):
+    """
+    Memoized schedules, for callers that ask for overlapping date ranges of the same few calendars over and over.
+
+    There is one cached schedule per (calendar, tz), covering a contiguous span of dates. A request inside the span is
+    a slice of it; a request outside of it only builds the missing dates (at least min_extension_days at a time),
+    which are joined onto the cached schedule. Since every part of a schedule is computed day by day, a schedule built
+    in pieces is the same as one built in one go.
+
+    The least recently used (calendar, tz) is dropped once there are more than max_entries.
+    """
+
+    def __init__(self, max_entries=16, initial_span_days=366, min_extension_days=90):
+        """
+        :param max_entries: number of (calendar, tz) schedules to keep
+        :param initial_span_days: the first schedule built for a (calendar, tz) covers at least this many days,
+            centered on the first request
+        :param min_extension_days: minimum number of days to extend the span by, when a request falls outside of it
+        """
+        self.max_entries = max_entries
+        self.initial_span = pd.Timedelta(days=initial_span_days)
+        self.min_extension = pd.Timedelta(days=min_extension_days)
+        self._entries = OrderedDict()  # (calendar key, tz) -> (span start, span end, schedule)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_schedule(self, calendar, start_date, end_date, tz='UTC'):
+        """
+        Same as calendar.schedule(start_date, end_date, tz), served from the cache.
+
+        :return: schedule DataFrame (a copy, so it can be modified without changing the cache)
+        """
+        start_date, end_date = clean_dates(start_date, end_date)
+        if not (start_date <= end_date):
+            raise ValueError('start_date must be before or equal to end_date.')
+        one_day = pd.Timedelta(days=1)
+        key = (calendar.schedule_cache_key(), tz if isinstance(tz, str) else repr(tz))
+        if key in self._entries:
+            span_start, span_end, schedule = self._entries[key]
+            pieces = [schedule]
+            if start_date < span_start:
+                new_span_start = min(start_date, span_start - self.min_extension)
+                pieces.insert(0, calendar._build_schedule(new_span_start, span_start - one_day, tz))
+                span_start = new_span_start
+            if span_end < end_date:
+                new_span_end = max(end_date, span_end + self.min_extension)
+                pieces.append(calendar._build_schedule(span_end + one_day, new_span_end, tz))
+                span_end = new_span_end
+            if len(pieces) > 1:
+                non_empty_pieces = [piece for piece in pieces if len(piece) > 0]
+                if len(non_empty_pieces) > 0:
+                    schedule = pd.concat(non_empty_pieces)
+            self._entries.move_to_end(key)
+        else:
+            padding = max(self.initial_span - (end_date - start_date), pd.Timedelta(0)) / 2
+            span_start = (start_date - padding).normalize()
+            span_end = (end_date + padding).normalize()
+            schedule = calendar._build_schedule(span_start, span_end, tz)
+            if len(self._entries) >= self.max_entries:
+                self._entries.popitem(last=False)
+        self._entries[key] = (span_start, span_end, schedule)
+        result = schedule.loc[start_date:end_date]
+        return result.copy() if len(result) > 0 else _empty_schedule()
+
+
+# Shared by every calendar's schedule(use_cache=True).
+schedule_cache = ScheduleCache()
+
+
+def _to_utc_datetime64(timestamps):
+    """
+    :return: numpy datetime64[ns] array of the timestamps in UTC (naive timestamps are taken to be UTC), NaT kept as NaT
+    """
+    index = pd.DatetimeIndex(timestamps)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return index.values.astype('datetime64[ns]')
+
+
+def _empty_schedule():
+    return pd.DataFrame(columns=['market_open', 'market_close'], index=pd.DatetimeIndex([], freq='C'))
+
+
 def days_at_time(days, t, tz, day_offset=0):
     """
     Create an index of days at time ``t``, interpreted in timezone ``tz``. The returned index is localized to UTC.
@@ -0,0 +1,42 @@
+import json
+import os
+import subprocess
+import sys
+
+# Gets the calendars in the given order, then prints the valid days of each (from before the precompiled holiday tables'
+# horizon, so they come from the holiday rules). Each order runs in a fresh interpreter, since the exchange modules are
+# only imported once per process.
+SCRIPT = \
+    '''
+import json, sys
+import pandas_market_calendars as pmc
+calendars = {name: pmc.get_calendar(name) for name in sys.argv[1:]}
+print(json.dumps({name: [str(day.date()) for day in calendar.valid_days('1998-01-01', '1999-12-31')]
+                  for name, calendar in calendars.items()}))
+'''
+
+
+# The vendored pandas_market_calendars is imported from src/, as src/MarketCalendar.py does.
+SRC_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+def validDaysAfterGetting(names):
+    env = dict(os.environ, PYTHONPATH=SRC_PATH)
+    output = subprocess.run([sys.executable, '-W', 'ignore', '-c', SCRIPT, *names], check=True, capture_output=True, text=True,
+                            env=env, cwd=SRC_PATH).stdout
+    return json.loads(output)
+
+
+def test_holidays_do_not_depend_on_get_calendar_order():
+    names = ['NYSE', 'ASX', 'TSX', 'EUREX', 'BMF']
+    expected = {name: validDaysAfterGetting([name])[name] for name in names}
+    for order in (names, names[::-1], ['ASX', 'NYSE'], ['NYSE', 'ASX']):
+        assert validDaysAfterGetting(order) == {name: expected[name] for name in order}, order
+
+
+def test_nyse_christmas_1998():
+    # Dec 25 1998 was a Friday; Dec 28 is ASX's Boxing Day (observed), but not an NYSE holiday.
+    for order in (['NYSE'], ['NYSE', 'ASX']):
+        validDays = validDaysAfterGetting(order)['NYSE']
+        assert [day for day in validDays if '1998-12-20' <= day <= '1998-12-31'] == \
+               ['1998-12-21', '1998-12-22', '1998-12-23', '1998-12-24', '1998-12-28', '1998-12-29', '1998-12-30', '1998-12-31']
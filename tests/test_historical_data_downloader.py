@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+from collections import defaultdict
+from types import SimpleNamespace
+
+from src.HistoricalDataDownloader import HistoricalDataDownloader
+
+
+class VirtualTime:
+
+    '''
+    A clock and sleep for HistoricalDataDownloader that don't actually wait: whenever every task is blocked,
+    time jumps ahead to the earliest sleeper, so hours of pacing waits run in well under a second.
+    '''
+
+    def __init__(me):
+        me.now = 0.0
+        me.sleepers = []
+        me.counter = itertools.count()
+
+    def clock(me):
+        return me.now
+
+    async def sleep(me, seconds: float):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(me.sleepers, (me.now + max(seconds, 0), next(me.counter), future))
+        await future
+
+    def run(me, coroutine):
+        async def runUntilDone():
+            task = asyncio.ensure_future(coroutine)
+            while not task.done():
+                for _ in range(50): # Let everything that can run, run.
+                    await asyncio.sleep(0)
+                if me.sleepers and not task.done():
+                    wakeTime, _, future = heapq.heappop(me.sleepers)
+                    me.now = max(me.now, wakeTime)
+                    future.set_result(None)
+            return task.result()
+        return asyncio.run(runUntilDone())
+
+
+class FakeIB:
+
+    '''
+    Answers reqHistoricalDataAsync() after latencySeconds (of virtual time), and records any request that would have broken
+    one of IB's pacing limits (see HistoricalDataDownloader) in .violations.
+    failuresByEndDateTime: endDateTime -> list of what the first requests for it do ('raise', 'empty', or 'hang'), before they succeed.
+    '''
+
+    def __init__(me, virtualTime: VirtualTime, latencySeconds: float = 1, failuresByEndDateTime: dict = None):
+        me.virtualTime = virtualTime
+        me.latencySeconds = latencySeconds
+        me.failuresByEndDateTime = {endDateTime: list(failures) for endDateTime, failures in (failuresByEndDateTime or {}).items()}
+        me.sentTimes = []
+        me.sentTimesByContract = defaultdict(list)
+        me.sentTimesByRequest = defaultdict(list)
+        me.open = 0
+        me.maxOpen = 0
+        me.violations = []
+
+    async def reqHistoricalDataAsync(me, **params):
+        now = me.virtualTime.clock()
+        requestKey = tuple(sorted((name, repr(value)) for name, value in params.items()))
+        contractKey = (repr(params['contract']), params['whatToShow'])
+        if any(now - sentTime < 15 for sentTime in me.sentTimesByRequest[requestKey]):
+            me.violations.append(('identical request within 15 s', now))
+        if params['barSizeSetting'].endswith('secs'):
+            if sum(now - sentTime < 600 for sentTime in me.sentTimes) >= 60:
+                me.violations.append(('more than 60 requests in 10 minutes', now))
+            if sum(now - sentTime < 2 for sentTime in me.sentTimesByContract[contractKey]) >= 5:
+                me.violations.append(('6 requests for the same contract within 2 s', now))
+            me.sentTimes.append(now)
+            me.sentTimesByContract[contractKey].append(now)
+        me.sentTimesByRequest[requestKey].append(now)
+        me.open += 1
+        me.maxOpen = max(me.maxOpen, me.open)
+        if me.open > 50:
+            me.violations.append(('more than 50 open requests', now))
+        try:
+            await me.virtualTime.sleep(me.latencySeconds)
+            failures = me.failuresByEndDateTime.get(params['endDateTime'], [])
+            failure = failures.pop(0) if failures else None
+            if failure == 'raise':
+                raise ConnectionError("Fake IB error")
+            if failure == 'hang': # Never answers (and isn't one of the virtual sleepers), so only a real timeout ends it.
+                await asyncio.get_running_loop().create_future()
+            if failure == 'empty':
+                return []
+            return [SimpleNamespace(date=now, close=1.0)]
+        finally:
+            me.open -= 1
+
+
+def makeRequests(numContracts: int, barSizeSetting: str, requestsPerContract: int = 1):
+    return {(strike, i): dict(contract=SimpleNamespace(symbol='AAPL', strike=strike, right='C', exchange='SMART'), endDateTime=i,
+                              durationStr='1 D', barSizeSetting=barSizeSetting, whatToShow='MIDPOINT', useRTH=True)
+            for strike in range(numContracts) for i in range(requestsPerContract)}
+
+
+def download(requests: dict, latencySeconds: float = 1, failuresByEndDateTime: dict = None, **downloaderArgs):
+    virtualTime = VirtualTime()
+    ib = FakeIB(virtualTime, latencySeconds, failuresByEndDateTime)
+    downloader = HistoricalDataDownloader(ib, clock=virtualTime.clock, sleep=virtualTime.sleep, **downloaderArgs)
+    results = virtualTime.run(downloader.downloadAsync(requests))
+    return results, downloader, ib
+
+
+def test_small_bars_stay_under_the_10_minute_limit_at_full_throughput():
+    results, downloader, ib = download(makeRequests(200, '30 secs'))
+    assert len(results) == 200 and ib.violations == []
+    # 60 requests per 10 minute window: the last 20 go out in the 4th window, right as it opens.
+    assert downloader.getMetrics()['elapsedSeconds'] <= 3*600 + 1 + 1e-9
+
+
+def test_large_bars_are_only_limited_by_simultaneous_requests():
+    results, downloader, ib = download(makeRequests(500, '1 hour'), latencySeconds=2)
+    assert len(results) == 500 and ib.violations == []
+    assert ib.maxOpen == 50
+    assert downloader.getMetrics()['elapsedSeconds'] <= 500/50*2 + 1e-9
+
+
+def test_same_contract_requests_are_spread_out():
+    results, downloader, ib = download(makeRequests(2, '5 secs', requestsPerContract=12), latencySeconds=0.1)
+    assert len(results) == 24 and ib.violations == []
+    # At most 5 per contract every 2 seconds, with both contracts going at once.
+    assert downloader.getMetrics()['elapsedSeconds'] <= 2*2 + 0.1 + 1e-9
+
+
+def test_retries_wait_out_the_identical_request_cooldown():
+    results, downloader, ib = download(makeRequests(1, '1 min'), failuresByEndDateTime={0: ['raise', 'raise']}, latencySeconds=0.5)
+    assert len(results) == 1 and ib.violations == []
+    assert downloader.failures == {}
+    assert downloader.getMetrics()['numRetries'] == 2
+    # The backoff is only 2 and 4 seconds, so each retry goes out 15 seconds after the previous attempt.
+    assert downloader.getMetrics()['elapsedSeconds'] == 2*15 + 0.5
+
+
+def test_requests_waiting_on_pacing_dont_hold_a_slot():
+    requests = makeRequests(1, '30 secs')
+    requests['identical'] = dict(requests[(0, 0)])
+    requests.update(makeRequests(2, '30 secs')) # (1, 0) is a different contract, so it can go out while 'identical' waits.
+    results, downloader, ib = download(requests, maxSimultaneousRequests=1)
+    assert len(results) == 3 and ib.violations == []
+    assert ib.sentTimes == [0, 1, 15]
+
+
+def test_expired_pacing_entries_are_dropped():
+    results, downloader, ib = download(makeRequests(500, '1 hour'), latencySeconds=2)
+    # Sent in rounds of 50 every 2 seconds, the last at 18 s; only the ones from the last 15 seconds (4 s on) can still hold anything up.
+    assert len(results) == 500 and len(downloader.lastRequestTimes) == 400
+    results, downloader, ib = download(makeRequests(100, '5 secs'), latencySeconds=0.5)
+    assert len(results) == 100 and len(downloader.sameContractTokenTimes) < 100
+
+
+def test_empty_results_are_returned_without_retrying():
+    results, downloader, ib = download(makeRequests(2, '1 hour'), failuresByEndDateTime={0: ['empty']})
+    assert sorted(len(bars) for bars in results.values()) == [0, 1]
+    assert downloader.failures == {}
+    metrics = downloader.getMetrics()
+    assert (metrics['numCompleted'], metrics['numEmpty'], metrics['numRetries'], metrics['numFailed']) == (2, 1, 0, 0)
+
+
+def test_empty_results_can_be_retried():
+    results, downloader, ib = download(makeRequests(1, '1 hour'), failuresByEndDateTime={0: ['empty', 'empty']}, retryEmptyResults=True)
+    assert [len(bars) for bars in results.values()] == [1]
+    assert downloader.getMetrics()['numRetries'] == 2
+    results, downloader, ib = download(makeRequests(1, '1 hour'), failuresByEndDateTime={0: ['empty']*4}, retryEmptyResults=True)
+    assert results == {} and downloader.failures == {(0, 0): "No data returned"}
+
+
+def test_timeouts_are_retried():
+    results, downloader, ib = download(makeRequests(1, '1 hour'), failuresByEndDateTime={0: ['hang']}, requestTimeoutSeconds=0.05)
+    assert [len(bars) for bars in results.values()] == [1]
+    assert downloader.failures == {} and downloader.getMetrics()['numRetries'] == 1